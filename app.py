@@ -1,21 +1,24 @@
 
 import streamlit as st
-from PIL import Image
-import io
 import random
+import re
+import secrets
+import time
+import uuid
 
 from src.config import config, validate_config
-from src.ai_engine import WaterFootprintAnalyzer
+from src.ai_engine import get_analyzer
+from src.client_pool import prewarm
+from src.history import get_history_store
 from src.models import WaterFootprintAnalysis, WaterImpactMetrics, AnalysisError
 from src.visualizations import (
     create_water_gauge, create_water_breakdown_donut, create_comparison_bar_chart,
     create_impact_comparison_cards, create_confidence_indicator, create_water_drop_animation,
     create_carbon_footprint_chart, create_cumulative_impact_chart, create_regional_context_map
 )
-from src.analytics import TrendAnalyzer, ChallengeEngine
+from src.analytics import TrendAnalyzer, RollingAggregates, FleetPercentiles, ChallengeEngine
 from src.utils import (
-    validate_image, resize_image_if_needed, get_image_mime_type,
-    get_relatable_comparison, get_disclaimer, get_category_icon,
+    prepare_image, get_relatable_comparison, get_disclaimer, get_category_icon,
     get_impact_level, format_number
 )
 
@@ -133,14 +136,68 @@ if 'result' not in st.session_state:
     st.session_state.result = None
 if 'image' not in st.session_state:
     st.session_state.image = None
-if 'history' not in st.session_state:
-    st.session_state.history = []
-if 'total_water' not in st.session_state:
-    st.session_state.total_water = 0
-if 'total_carbon' not in st.session_state:
-    st.session_state.total_carbon = 0
-if 'challenge' not in st.session_state:
-    st.session_state.challenge = ChallengeEngine.generate_weekly_challenge([])
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'prepared_images' not in st.session_state:
+    st.session_state.prepared_images = {}
+
+
+def get_prepared_image(upload):
+    # Decode each upload once; later reruns reuse the PreparedImage as-is
+    prepared = st.session_state.prepared_images
+    if upload.file_id not in prepared:
+        prepared.clear()
+        prepared[upload.file_id] = prepare_image(upload.getvalue())
+    return prepared[upload.file_id]
+
+
+USER_TOKEN = re.compile(r'[A-Za-z0-9_-]{32,64}')
+
+
+def get_user_id():
+    # Kept in the page URL so history survives reconnects and reloads. The
+    # uid is a capability: anyone holding the link can read and add to that
+    # history, so it must be unguessable; short or hand-made ids such as
+    # ?uid=alice are replaced with a fresh random token
+    user_id = st.query_params.get('uid')
+    if not user_id or not USER_TOKEN.fullmatch(user_id):
+        user_id = st.query_params['uid'] = secrets.token_urlsafe(32)
+    return user_id
+
+
+history = get_history_store()
+user_id = get_user_id()
+totals = history.totals(user_id)
+
+if 'columns' not in st.session_state or len(st.session_state.columns) != totals['items']:
+    # Loaded once per session (or when another tab recorded scans); after
+    # that each new scan is an O(1) update instead of a full recompute
+    columns = st.session_state.columns = history.columns(user_id)
+    st.session_state.rollups = RollingAggregates.from_columns(columns)
+
+# The weekly challenge and "this week" figures come from the last 7 days of
+# hourly buckets, not from the whole history
+rollups = st.session_state.rollups
+st.session_state.challenge = ChallengeEngine.challenge_for(rollups.summary(7))
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_analyzer():
+    # One analyzer and pooled genai client per key for every session; the TLS
+    # handshakes happen in the background while the page first renders
+    analyzer = get_analyzer()
+    for endpoint in analyzer.balancer.endpoints:
+        prewarm(endpoint.api_key, endpoint.model_name)
+    return analyzer
+
+
+
+@st.cache_resource(ttl=600, show_spinner=False)
+def get_fleet_percentiles():
+    # Rebuilt from the store every 10 minutes in one streaming pass; ranking
+    # a user is then a lookup in a few hundred sketch items
+    return FleetPercentiles.from_store(get_history_store())
+
 
 st.markdown(
     f'<div class="main-header">'
@@ -153,13 +210,22 @@ st.markdown(
 with st.sidebar:
     st.markdown(f'<h2 style="color: #667eea; font-weight: 700; margin-bottom: 1.5rem;">{config.APP_ICON} Your Impact</h2>', unsafe_allow_html=True)
     
+    week = rollups.window(7)
     col1, col2 = st.columns(2)
-    col1.metric("💧 Water", format_number(st.session_state.total_water) + "L", delta=None)
-    col2.metric("🌍 Carbon", f"{st.session_state.total_carbon:.0f}kg", delta=None)
+    col1.metric("💧 Water", format_number(totals['total_liters']) + "L",
+                delta=f"{format_number(week['total_liters'])}L this week" if week['items'] else None,
+                delta_color="off")
+    col2.metric("🌍 Carbon", f"{totals['carbon_kg']:.0f}kg",
+                delta=f"{week['carbon_kg']:.0f}kg this week" if week['items'] else None,
+                delta_color="off")
+    
+    fleet = get_fleet_percentiles()
+    if totals['items'] >= 3 and len(fleet.users) >= 20:
+        top = fleet.water_conscious_rank(totals['total_liters'] / totals['items'])
+        st.caption(f"🏅 Top {top:.0f}% of water-conscious scanners")
     
-    if len(st.session_state.history) >= 3:
-        analyzer = TrendAnalyzer(st.session_state.history)
-        milestone = analyzer.get_milestone_progress(st.session_state.total_water)
+    if totals['items'] >= 3:
+        milestone = TrendAnalyzer.get_milestone_progress(totals['total_liters'])
         
         if milestone.get('next'):
             st.markdown("---")
@@ -190,53 +256,96 @@ if not ok:
     st.caption("Or set environment variable: `GEMINI_API_KEY=your_key`")
     st.stop()
 
+get_shared_analyzer()
+
 st.markdown('<div class="section-title">📸 Analyze a Product</div>', unsafe_allow_html=True)
 
 tab1, tab2 = st.tabs(["📁 Upload Image", "📷 Take Photo"])
 
-image_data = None
+upload = None
 with tab1:
     uploaded = st.file_uploader(
         "Drop your product photo here",
         type=['jpg', 'jpeg', 'png', 'webp']
     )
     if uploaded:
-        image_data = uploaded.getvalue()
+        upload = uploaded
         st.success(f"✓ {uploaded.name} loaded")
 
 with tab2:
     camera = st.camera_input("📷 Snap a photo")
     if camera:
-        image_data = camera.getvalue()
+        upload = camera
         st.success("✓ Got it!")
 
 
-if image_data:
-    valid, err = validate_image(image_data)
-    if not valid:
+if upload:
+    prepared, err = get_prepared_image(upload)
+    if err:
         st.error(f"⚠️ {err}")
         st.stop()
     
-    image_data = resize_image_if_needed(image_data)
+    if prepared.optimized:
+        savings = f"Optimized for AI: {prepared.original_bytes / 1024:,.0f}KB → {len(prepared.data) / 1024:,.0f}KB"
+        if prepared.tokens_saved:
+            savings += f", ~{prepared.original_tokens:,} → {prepared.estimated_tokens:,} image tokens"
+        st.caption(savings)
     st.markdown("---")
     
     col, _ = st.columns([1, 3])
     if col.button("🔍 Analyze", type="primary", use_container_width=True):
-        with st.spinner(""):
-            st.markdown(create_water_drop_animation(), unsafe_allow_html=True)
-            st.markdown("<p style='text-align: center; color: #1E88E5;'><b>Uncovering hidden water...</b></p>", unsafe_allow_html=True)
+        analyzer = get_shared_analyzer()
+        
+        if config.STREAM_RESPONSES:
+            loading = st.empty()
+            loading.markdown(
+                create_water_drop_animation() +
+                "<p style='text-align: center; color: #1E88E5;'><b>Uncovering hidden water...</b></p>",
+                unsafe_allow_html=True
+            )
+            preview_info, preview_gauge = st.columns([2, 1])
+            headline = preview_info.empty()
+            gauge = preview_gauge.empty()
+            gauge_drawn = False
             
-            analyzer = WaterFootprintAnalyzer()
-            mime = get_image_mime_type(image_data)
-            result = analyzer.analyze_image(image_data, mime)
-            st.session_state.result = result
-            st.session_state.image = image_data
+            for fields, result in analyzer.analyze_image_stream(prepared.data, prepared.mime_type):
+                if result is not None:
+                    break
+                loading.empty()
+                if 'product_name' in fields:
+                    liters = fields.get('total_liters')
+                    carbon = fields.get('carbon_kg')
+                    headline.markdown(
+                        f'<div class="product-card">'
+                        f'<h2 style="margin: 0; font-size: 2rem; font-weight: 700; color: #fff;">{get_category_icon(str(fields.get("product_category", "other")))} {fields["product_name"]}</h2>'
+                        + (f'<p style="color: #a0a0a0; margin: 0.75rem 0; font-size: 0.95rem;">💧 {liters:,.0f} L</p>' if isinstance(liters, (int, float)) else '')
+                        + (f'<p style="color: #a0a0a0; margin: 0.75rem 0; font-size: 0.95rem;">🌍 {carbon:.1f} kg CO₂</p>' if isinstance(carbon, (int, float)) else '')
+                        + '</div>',
+                        unsafe_allow_html=True
+                    )
+                if not gauge_drawn and isinstance(fields.get('total_liters'), (int, float)):
+                    gauge.plotly_chart(create_water_gauge(fields['total_liters']), use_container_width=True, config={'displayModeBar': False})
+                    gauge_drawn = True
+        else:
+            with st.spinner(""):
+                st.markdown(create_water_drop_animation(), unsafe_allow_html=True)
+                st.markdown("<p style='text-align: center; color: #1E88E5;'><b>Uncovering hidden water...</b></p>", unsafe_allow_html=True)
+                result = analyzer.analyze_image(prepared.data, prepared.mime_type)
         
+        if isinstance(result, WaterFootprintAnalysis):
+            # Recorded once per upload; reruns while it is displayed add nothing
+            session_id = st.session_state.session_id
+            created = time.time()
+            if history.add(user_id, result, f"{session_id}:{upload.file_id}", session_id, created):
+                st.session_state.columns.append(result, created)
+                st.session_state.rollups.update(result, created)
+        st.session_state.result = result
+        st.session_state.image = prepared
         st.rerun()
 
 if st.session_state.result and st.session_state.image:
     result = st.session_state.result
-    img_data = st.session_state.image
+    prepared_image = st.session_state.image
     
     if isinstance(result, AnalysisError):
         st.markdown('<div style="background: linear-gradient(135deg, #ff6b6b 0%, #ee5a6f 100%); padding: 2rem; border-radius: 20px; color: white; margin: 2rem 0;">' +
@@ -259,10 +368,6 @@ if st.session_state.result and st.session_state.image:
             st.code(f"Type: {result.error_type}\nMessage: {result.message}", language="text")
     
     elif isinstance(result, WaterFootprintAnalysis):
-        st.session_state.total_water += result.total_liters
-        st.session_state.total_carbon += getattr(result, 'carbon_kg', 0)
-        st.session_state.history.append(result)
-        
         metrics = WaterImpactMetrics.from_liters(result.total_liters)
         level, color, desc = get_impact_level(result.total_liters)
         
@@ -271,8 +376,7 @@ if st.session_state.result and st.session_state.image:
         col_img, col_info = st.columns([1, 2])
         
         with col_img:
-            img = Image.open(io.BytesIO(img_data))
-            st.image(img, caption="Analyzed Product", use_container_width=True)
+            st.image(prepared_image.thumbnail, caption="Analyzed Product", use_container_width=True)
         
         with col_info:
             icon = get_category_icon(result.product_category)
@@ -315,9 +419,9 @@ if st.session_state.result and st.session_state.image:
         if carbon > 0:
             v3.plotly_chart(create_carbon_footprint_chart(carbon, getattr(result.sustainable_swap, 'carbon_kg', 0)), use_container_width=True, config={'displayModeBar': False})
         
-        if len(st.session_state.history) >= 2:
+        if totals['items'] >= 2:
             st.markdown('<div class="section-title">📈 Your Impact Journey</div>', unsafe_allow_html=True)
-            st.plotly_chart(create_cumulative_impact_chart(st.session_state.history), use_container_width=True, config={'displayModeBar': False})
+            st.plotly_chart(create_cumulative_impact_chart(st.session_state.columns), use_container_width=True, config={'displayModeBar': False})
         
         if hasattr(result, 'regional_impact') and result.regional_impact:
             st.markdown('<div class="section-title">🌍 Global Context</div>', unsafe_allow_html=True)
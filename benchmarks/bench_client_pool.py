@@ -0,0 +1,140 @@
+import datetime
+import ipaddress
+import json
+import os
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["RATE_LIMIT_RPM"] = "0"
+
+from src.ai_engine import WaterFootprintAnalyzer
+from src.catalog import CATALOG, analysis_from_entry
+from src.client_pool import create_client, warm_up
+
+
+# Stand-in for the Gemini endpoint over local TLS. `rtt` seconds are added per
+# request, and HANDSHAKE_RTTS * rtt per new connection (TCP + TLS 1.3 setup).
+HANDSHAKE_RTTS = 2
+MODEL = "gemini-2.5-flash"
+API_KEY = "bench-key"
+
+
+def self_signed_context(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = Path(directory) / "cert.pem", Path(directory) / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def start_server(context, rtt):
+    body = json.dumps({
+        "candidates": [{"content": {"role": "model", "parts": [{"text": analysis_from_entry(CATALOG[0]).model_dump_json()}]}}],
+        "usageMetadata": {"promptTokenCount": 1500, "candidatesTokenCount": 400},
+    }).encode()
+    stats = {'connections': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = 1 << 16  # one write per response; avoids Nagle/delayed-ACK stalls
+
+        def setup(self):
+            stats['connections'] += 1
+            time.sleep(HANDSHAKE_RTTS * rtt)
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.request.do_handshake()
+            super().setup()
+
+        def _reply(self, payload):
+            time.sleep(rtt)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply(json.dumps({"name": f"models/{MODEL}"}).encode())
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._reply(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def get_request(self):
+            sock, addr = self.socket.accept()
+            return context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), addr
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def timed_call(make_analyzer, i):
+    start = time.perf_counter()
+    analyzer = make_analyzer()
+    result = analyzer.analyze_image(f"image {i}".encode(), "image/jpeg")
+    assert result.__class__.__name__ == "WaterFootprintAnalysis", result
+    return (time.perf_counter() - start) * 1000
+
+
+def run(calls=20, rtts=(0.0, 0.03)):
+    with tempfile.TemporaryDirectory() as tmp:
+        context = self_signed_context(tmp)
+        for rtt in rtts:
+            server, stats = start_server(context, rtt)
+            url = f"https://127.0.0.1:{server.server_address[1]}"
+            new_analyzer = lambda: WaterFootprintAnalyzer(API_KEY, use_cache=False, client=create_client(
+                API_KEY, base_url=url, verify=str(Path(tmp) / "cert.pem")
+            ))
+
+            # Before: app.py built a new analyzer (and genai.Client) on every click
+            per_click = [timed_call(new_analyzer, i) for i in range(calls)]
+            per_click_connections = stats['connections']
+
+            shared = new_analyzer()
+            cold = [timed_call(lambda: shared, i) for i in range(calls)]
+
+            warmed = new_analyzer()
+            warm_up(warmed.client, MODEL)
+            first_warm = timed_call(lambda: warmed, 0)
+
+            print(f"--- simulated RTT {rtt * 1000:.0f}ms, {calls} sequential analyses")
+            print(f"new client per click  first {per_click[0]:7.1f}ms  steady median {statistics.median(per_click[1:]):7.1f}ms  "
+                  f"connections {per_click_connections}")
+            print(f"shared client         first {cold[0]:7.1f}ms  steady median {statistics.median(cold[1:]):7.1f}ms  "
+                  f"connections {stats['connections'] - per_click_connections - 1}")
+            print(f"shared + pre-warmed   first {first_warm:7.1f}ms")
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    run()
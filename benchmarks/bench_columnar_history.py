@@ -0,0 +1,94 @@
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.analytics import TrendAnalyzer
+from src.catalog import CATALOG, analysis_from_entry
+from src.history import ColumnarHistory
+
+
+def legacy_summary(history):
+    # TrendAnalyzer.get_weekly_summary/detect_patterns before the columnar
+    # history: several passes over the list of Pydantic objects
+    total_water = sum(a.total_liters for a in history)
+    total_carbon = sum(getattr(a, 'carbon_kg', 0) for a in history)
+    categories = defaultdict(int)
+    for analysis in history:
+        categories[analysis.product_category] += 1
+    top_category = max(categories.items(), key=lambda x: x[1])[0]
+    potential_savings = sum(a.sustainable_swap.savings_liters for a in history)
+    carbon_savings = sum(getattr(a.sustainable_swap, 'carbon_kg', 0) for a in history if getattr(a, 'carbon_kg', 0) > 0)
+    names = [a.product_category for a in history]
+    repeated = names.count(names[-1]) >= 3
+    high_water = len([a for a in history if a.total_liters > 5000])
+    avg_confidence = sum(a.confidence_score for a in history) / len(history)
+    return total_water, total_carbon, top_category, potential_savings, carbon_savings, repeated, high_water, avg_confidence
+
+
+def legacy_chart_data(history):
+    # The loop create_cumulative_impact_chart ran before building traces
+    cumulative_water, cumulative_carbon, items = [], [], []
+    running_water = running_carbon = 0
+    for i, analysis in enumerate(history, 1):
+        running_water += analysis.total_liters
+        running_carbon += getattr(analysis, 'carbon_kg', 0)
+        cumulative_water.append(running_water)
+        cumulative_carbon.append(running_carbon)
+        items.append(f"Item {i}")
+    return cumulative_water, cumulative_carbon, items
+
+
+def columnar_chart_data(columns):
+    import numpy as np
+    return (np.cumsum(columns['total_liters']), np.cumsum(columns['carbon_kg']),
+            np.char.add("Item ", np.arange(1, len(columns) + 1).astype(str)))
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(sizes=(10**3, 10**4, 10**5, 10**6)):
+    # A pool of distinct analyses repeated by reference: iteration cost is
+    # what matters, and 10^6 separate models would not fit in memory
+    pool = [analysis_from_entry(entry, quantity) for entry in CATALOG for quantity in (0.5, 1, 2)]
+    print(f"{'items':>9} | {'list summary':>12} {'columnar':>9} | {'list chart':>10} {'columnar':>9} | "
+          f"{'append/item':>11} {'bytes/item':>10}")
+    for n in sizes:
+        history = [pool[i % len(pool)] for i in range(n)]
+
+        started = time.perf_counter()
+        columns = ColumnarHistory()
+        for i, analysis in enumerate(history):
+            columns.append(analysis, float(i))
+        append_us = (time.perf_counter() - started) / n * 1e6
+
+        analyzer = TrendAnalyzer(columns)
+        list_summary = timed(lambda: legacy_summary(history))
+        columnar_summary = timed(lambda: (analyzer.get_weekly_summary(), analyzer.detect_patterns()))
+        list_chart = timed(lambda: legacy_chart_data(history))
+        columnar_chart = timed(lambda: columnar_chart_data(columns))
+
+        print(f"{n:>9,} | {list_summary:10.2f}ms {columnar_summary:7.2f}ms | {list_chart:8.2f}ms {columnar_chart:7.2f}ms | "
+              f"{append_us:9.2f}us {columns.nbytes / n:10.0f}")
+
+    tracemalloc.start()
+    columns = ColumnarHistory()
+    for i in range(10**5):
+        columns.append(pool[i % len(pool)], float(i))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"ColumnarHistory peak allocation for 10^5 appends: {peak / 1e6:.1f}MB")
+
+
+if __name__ == "__main__":
+    run()
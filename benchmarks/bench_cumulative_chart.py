@@ -0,0 +1,67 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.history import ColumnarHistory
+from src.visualizations import create_cumulative_impact_chart, lttb
+
+
+def legacy_chart(columns):
+    # create_cumulative_impact_chart before downsampling: SVG traces with one
+    # "Item i" label per scan on both traces
+    items = np.char.add("Item ", np.arange(1, len(columns) + 1).astype(str))
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Scatter(x=items, y=np.cumsum(columns['total_liters']), name="Water (L)",
+                             fill='tozeroy'), secondary_y=False)
+    fig.add_trace(go.Scatter(x=items, y=np.cumsum(columns['carbon_kg']), name="CO₂ (kg)",
+                             fill='tozeroy'), secondary_y=True)
+    return fig
+
+
+def history(n, seed=0):
+    rng = np.random.default_rng(seed)
+    liters = rng.lognormal(7, 2, n)
+    columns = ColumnarHistory(n)
+    columns.extend_rows(zip(np.arange(n, dtype=np.float64), liters, liters / 800, np.zeros(n), np.zeros(n),
+                            np.full(n, 0.9), ['Food'] * n))
+    return columns
+
+
+def built(fn, columns, repeat):
+    # Figure construction plus serialization, which is what reaches the browser
+    best, payload = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = fn(columns).to_json()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, len(payload)
+
+
+def max_shape_error(columns, budget):
+    # Largest gap between the full cumulative curve and the downsampled one,
+    # interpolated back onto every scan, relative to the final total
+    x = np.arange(1, len(columns) + 1, dtype=np.float64)
+    y = np.cumsum(columns['total_liters'])
+    keep = lttb(x, y, budget)
+    return float(np.max(np.abs(np.interp(x, x[keep], y[keep]) - y)) / y[-1])
+
+
+def run(sizes=(10**4, 10**5, 10**6), budget=1000):
+    print(f"point budget {budget}")
+    print(f"{'scans':>9} | {'legacy build':>12} {'payload':>9} | {'new build':>9} {'payload':>8} | {'shape error':>11}")
+    for n in sizes:
+        columns = history(n)
+        legacy_ms, legacy_bytes = built(legacy_chart, columns, 1 if n >= 10**6 else 3)
+        new_ms, new_bytes = built(lambda c: create_cumulative_impact_chart(c, point_budget=budget), columns, 3)
+        print(f"{n:>9,} | {legacy_ms:10.0f}ms {legacy_bytes / 1e6:7.1f}MB | {new_ms:7.0f}ms {new_bytes / 1e3:6.0f}KB | "
+              f"{max_shape_error(columns, budget):10.3%}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,71 @@
+import sys
+import time
+from pathlib import Path
+
+import plotly.io as pio
+import plotly.tools
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import visualizations
+from src.catalog import CATALOG, analysis_from_entry
+from src.models import RegionalImpact, WaterImpactMetrics
+
+
+def result_page(analysis):
+    # The figures app.py draws for one displayed result
+    metrics = WaterImpactMetrics.from_liters(analysis.total_liters)
+    swap = analysis.sustainable_swap
+    return [
+        visualizations.create_confidence_indicator(analysis.confidence_score),
+        visualizations.create_water_gauge(analysis.total_liters),
+        visualizations.create_water_breakdown_donut(analysis),
+        visualizations.create_carbon_footprint_chart(analysis.carbon_kg, swap.carbon_kg),
+        visualizations.create_regional_context_map(analysis.regional_impact),
+        visualizations.create_impact_comparison_cards(metrics),
+        visualizations.create_comparison_bar_chart(analysis.product_name, analysis.total_liters, swap.product_name,
+                                                   swap.water_liters, swap.savings_percentage),
+    ]
+
+
+def rerun(analysis):
+    # Figure construction plus what st.plotly_chart does with each figure
+    for fig in result_page(analysis):
+        if fig is not None:
+            pio.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+def timed(fn, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run():
+    analysis = analysis_from_entry(CATALOG[0]).model_copy(update={'regional_impact': RegionalImpact(
+        high_stress_regions=["Spain", "India", "California"], scarcity_multiplier=2.4,
+        context="Grown in water-stressed regions")})
+
+    builders = [getattr(visualizations, name) for name in dir(visualizations) if name.startswith('create_')]
+    uncached = {b.__name__: getattr(b, '__wrapped__', b) for b in builders}
+    saved = {name: getattr(visualizations, name) for name in uncached}
+    for name, build in uncached.items():
+        setattr(visualizations, name, build)
+    cold = timed(lambda: rerun(analysis))
+    for name, build in saved.items():
+        setattr(visualizations, name, build)
+
+    rerun(analysis)
+    warm = timed(lambda: rerun(analysis))
+    renamed = analysis.model_copy(update={'product_name': analysis.product_name + " (again)"})
+    print(f"chart layer per rerun: {cold:.1f}ms without the cache, {warm:.2f}ms from the cache")
+    print(f"cache after the runs: {visualizations.figure_cache_stats()}")
+    timed(lambda: rerun(renamed), repeat=1)
+    print(f"after a re-analysis with a new name (only the swap bar depends on it): {visualizations.figure_cache_stats()}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["RATE_LIMIT_RPM"] = "0"
+
+from src.ai_engine import AsyncWaterFootprintAnalyzer, WaterFootprintAnalyzer
+from src.catalog import CATALOG, analysis_from_entry
+from src.hedging import Hedger
+from src.metrics import get_metrics
+
+
+RESPONSE = analysis_from_entry(CATALOG[0]).model_dump_json()
+# Scaled-down production shape: p50 ~30ms, 3% of calls stall for 150-300ms
+BASE, SLOW_RATE, SLOW = 0.03, 0.03, (0.15, 0.3)
+
+
+def upstream_latency(rng):
+    if rng.random() < SLOW_RATE:
+        return rng.uniform(*SLOW)
+    return BASE * rng.lognormvariate(0, 0.2)
+
+
+class StubModels:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.completed = 0  # calls that ran to the end rather than being cancelled
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content_async))
+
+    def generate_content(self, **request):
+        self.calls += 1
+        time.sleep(upstream_latency(self.rng))
+        self.completed += 1
+        return SimpleNamespace(text=RESPONSE, usage_metadata=None)
+
+    async def generate_content_async(self, **request):
+        self.calls += 1
+        await asyncio.sleep(upstream_latency(self.rng))
+        self.completed += 1
+        return SimpleNamespace(text=RESPONSE, usage_metadata=None)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[int(0.99 * (len(ordered) - 1))]
+
+
+def report(label, latencies, stub, requests):
+    p50, p99 = percentiles(latencies)
+    print(f"{label:24s} p50 {p50 * 1000:6.1f}ms  p99 {p99 * 1000:6.1f}ms  "
+          f"upstream calls/request: {stub.calls / requests:.3f} started, {stub.completed / requests:.3f} completed")
+
+
+def run_sync(requests, workers, hedger):
+    stub = StubModels(seed=1)
+    analyzer = WaterFootprintAnalyzer("bench-key", use_cache=False, client=SimpleNamespace(models=stub, aio=stub.aio),
+                                      hedger=hedger)
+
+    def timed(i):
+        started = time.perf_counter()
+        analyzer.analyze_image(f"image {i}".encode())
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(workers) as pool:
+        latencies = list(pool.map(timed, range(requests)))
+    time.sleep(max(SLOW))  # let any uncancelled loser finish
+    return latencies, stub
+
+
+async def run_async(requests, concurrency, hedger):
+    stub = StubModels(seed=1)
+    analyzer = AsyncWaterFootprintAnalyzer("bench-key", use_cache=False, client=SimpleNamespace(models=stub, aio=stub.aio),
+                                           hedger=hedger)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def timed(i):
+        async with gate:
+            started = time.perf_counter()
+            await analyzer.analyze_image(f"image {i}".encode())
+            return time.perf_counter() - started
+
+    latencies = await asyncio.gather(*(timed(i) for i in range(requests)))
+    await asyncio.sleep(max(SLOW))  # let any uncancelled loser finish
+    return latencies, stub
+
+
+def run(requests=2000, workers=8):
+    print(f"{requests} requests, {workers} concurrent; hedge at p95, budget 5%")
+    latencies, stub = run_sync(requests, workers, None)
+    report("sync, no hedging", latencies, stub, requests)
+    latencies, stub = run_sync(requests, workers, Hedger("bench-sync", percentile=0.95, max_rate=0.05))
+    report("sync, hedged", latencies, stub, requests)
+
+    latencies, stub = asyncio.run(run_async(requests, workers, None))
+    report("async, no hedging", latencies, stub, requests)
+    latencies, stub = asyncio.run(run_async(requests, workers, Hedger("bench-async", percentile=0.95, max_rate=0.05)))
+    report("async, hedged", latencies, stub, requests)
+
+    print("Exported metrics:")
+    snapshot = get_metrics().snapshot()
+    for entry in snapshot['summaries'].get('blueprint_hedge_latency_seconds', []):
+        labels = entry['labels']
+        print(f"  hedge_latency_seconds {labels['flight']:11s} {labels['path']:17s} p99 {entry['p99'] * 1000:6.1f}ms")
+    for entry in snapshot['counters'].get('blueprint_hedges_total', []):
+        labels = entry['labels']
+        print(f"  hedges_total          {labels['flight']:11s} {labels['outcome']:16s} {entry['value']:g}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,69 @@
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.catalog import CATALOG, analysis_from_entry
+from src.json_tools import extract_json_object
+
+
+def legacy_extract(text):
+    # WaterFootprintAnalyzer._extract_json before the single-pass scanner
+    text = text.strip()
+    for pattern in [r'```json\s*(\{.*?\})\s*```', r'```\s*(\{.*?\})\s*```', r'(\{.*\})']:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1).strip())
+            except json.JSONDecodeError:
+                continue
+    return json.loads(text)
+
+
+def large_analysis(size):
+    doc = analysis_from_entry(CATALOG[0]).model_dump(mode='json')
+    step = 'Swap {this} for [that], "quoted" \\ and keep going; '
+    doc['actionable_steps'] = [step * 4] * (size // (len(step) * 4) + 1)
+    return json.dumps(doc, indent=2)
+
+
+def cases(size):
+    body = large_analysis(size)
+    return {
+        'valid, fenced': f"```json\n{body}\n```",
+        'prose braces + fence': "{note} " * (size // 7) + f"```json\n{body}\n```",
+        'truncated': body[:len(body) * 9 // 10],
+        'trailing commas': body.replace('\n  ]', ',\n  ]').replace('\n}', ',\n}'),
+        'unclosed braces': "{ " * (size // 2),
+        'open fences': "```json\n{ " * (size // 10),
+    }
+
+
+def run(sizes=(10_000, 30_000, 100_000, 300_000), legacy_budget_s=20.0):
+    legacy_slow = set()
+    for size in sizes:
+        print(f"--- ~{size // 1000}KB inputs")
+        for name, text in cases(size).items():
+            outcome = {}
+            for label, fn in (('legacy', legacy_extract), ('scanner', extract_json_object)):
+                if label == 'legacy' and name in legacy_slow:
+                    outcome[label] = "skipped (over budget at a smaller size)"
+                    continue
+                start = time.perf_counter()
+                try:
+                    fn(text)
+                    ok = 'ok'
+                except json.JSONDecodeError:
+                    ok = 'fail'
+                elapsed = time.perf_counter() - start
+                if label == 'legacy' and elapsed > legacy_budget_s / len(sizes):
+                    legacy_slow.add(name)
+                outcome[label] = f"{ok:4s} {elapsed * 1000:9.1f}ms"
+            print(f"{name:22s} {len(text) / 1000:6.0f}KB  legacy {outcome['legacy']:22s}  scanner {outcome['scanner']}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Per-key quota the bucket is sized to: 10 requests/s, no burst
+os.environ["RATE_LIMIT_RPM"] = "600"
+os.environ["RATE_LIMIT_BURST"] = "1"
+
+from google.genai import errors
+
+from src.ai_engine import WaterFootprintAnalyzer
+from src.balancer import Endpoint, LoadBalancer
+from src.catalog import CATALOG, analysis_from_entry
+
+
+RESPONSE = analysis_from_entry(CATALOG[0]).model_dump_json()
+
+
+class StubModels:
+    # Gemini stand-in for one key: fixed latency, optionally rejecting the key
+    def __init__(self, latency, reject=False):
+        self.latency = latency
+        self.reject = reject
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, **request):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.reject:
+            raise errors.APIError(403, {'error': {'code': 403, 'status': 'PERMISSION_DENIED', 'message': 'API key not valid'}})
+        return SimpleNamespace(text=RESPONSE, usage_metadata=None)
+
+
+def make_analyzer(run, latencies, strategy, reject=()):
+    stubs = [StubModels(latency, i in reject) for i, latency in enumerate(latencies)]
+    endpoints = [Endpoint(f"{run}-key-{i}", "gemini-2.5-flash", client=SimpleNamespace(models=stub))
+                 for i, stub in enumerate(stubs)]
+    balancer = LoadBalancer(endpoints, strategy=strategy)
+    return WaterFootprintAnalyzer(use_cache=False, balancer=balancer), stubs
+
+
+def throughput(analyzer, requests, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(lambda i: analyzer.analyze_image(f"image {i}".encode()), range(requests)))
+    elapsed = time.perf_counter() - start
+    ok = sum(type(r).__name__ == "WaterFootprintAnalysis" for r in results)
+    return requests / elapsed, ok
+
+
+def run(latency=0.05, per_key_requests=30, workers=32):
+    print("Scaling with keys (each key limited to 10 req/s)")
+    for strategy in ('least_loaded', 'weighted_round_robin'):
+        for keys in (1, 2, 4, 8):
+            analyzer, stubs = make_analyzer(f"{strategy}-{keys}", [latency] * keys, strategy)
+            rate, ok = throughput(analyzer, per_key_requests * keys, workers)
+            print(f"{strategy:21s} {keys} keys  {rate:6.1f} req/s  ok {ok}/{per_key_requests * keys}  "
+                  f"per key {[s.calls for s in stubs]}")
+
+    print("Heterogeneous latency (50ms, 50ms, 200ms, 200ms), least_loaded")
+    analyzer, stubs = make_analyzer("mixed", [0.05, 0.05, 0.2, 0.2], 'least_loaded')
+    rate, ok = throughput(analyzer, 120, workers)
+    print(f"{rate:6.1f} req/s  per key {[s.calls for s in stubs]}")
+
+    print("One of four keys rejected (403): ejected after its first failure")
+    analyzer, stubs = make_analyzer("reject", [latency] * 4, 'least_loaded', reject={0})
+    rate, ok = throughput(analyzer, 120, workers)
+    print(f"{rate:6.1f} req/s  ok {ok}/120  per key {[s.calls for s in stubs]}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,45 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.cache import HammingIndex
+
+
+def run(size=1_000_000, queries=2_000, max_distance=6, seed=0):
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2**64 - 1, size, dtype=np.uint64)
+
+    index = HammingIndex(max_distance)
+    start = time.perf_counter()
+    index.add_many(hashes, range(size))
+    build_s = time.perf_counter() - start
+
+    # Half the queries are near-duplicates of indexed hashes, half are random misses
+    targets = []
+    for i in range(queries):
+        h = int(hashes[rng.integers(size)])
+        if i % 2 == 0:
+            for bit in rng.choice(64, rng.integers(0, max_distance + 1), replace=False):
+                h ^= 1 << int(bit)
+        else:
+            h = int(rng.integers(0, 2**64 - 1, dtype=np.uint64))
+        targets.append(h)
+
+    timings = []
+    for h in targets:
+        start = time.perf_counter()
+        index.query(h)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1e6
+
+    print(f"indexed={size:,} build={build_s:.2f}s max_distance={max_distance}")
+    print(f"query p50={np.percentile(timings, 50):.0f}us p99={np.percentile(timings, 99):.0f}us "
+          f"mean={timings.mean():.0f}us hits={index.hits} misses={index.misses}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,58 @@
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.utils import validate_image, resize_image_if_needed, get_image_mime_type, prepare_image
+
+
+def make_photo(width, height, fmt='JPEG', seed=0):
+    # Smooth gradients plus sensor-like noise compress roughly like a real phone photo
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format=fmt, quality=92)
+    return output.getvalue()
+
+
+def legacy_pipeline(image_data):
+    # What app.py did per rerun before PreparedImage: four separate decodes
+    validate_image(image_data, max_size_mb=100)
+    data = resize_image_if_needed(image_data)
+    get_image_mime_type(data)
+    Image.open(io.BytesIO(data)).load()
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run():
+    memo = {}
+    for label, (w, h), fmt in [("12MP JPEG", (4032, 3024), 'JPEG'), ("48MP JPEG", (8064, 6048), 'JPEG'),
+                               ("12MP PNG", (4032, 3024), 'PNG')]:
+        data = make_photo(w, h, fmt)
+        legacy = timed(lambda: legacy_pipeline(data))
+        prepared = timed(lambda: prepare_image(data, max_size_mb=100))
+        memo['upload'], _ = prepare_image(data, max_size_mb=100)
+        rerun = timed(lambda: memo.get('upload'), repeat=1000)
+        p = memo['upload']
+        print(f"{label:10s} {len(data) / 1e6:6.1f}MB  legacy per rerun={legacy:7.1f}ms  prepare_image once={prepared:7.1f}ms  "
+              f"memoized rerun={rerun * 1000:.2f}us  payload {len(data) / 1e3:,.0f}KB->{len(p.data) / 1e3:,.0f}KB  "
+              f"tokens ~{p.original_tokens:,}->{p.estimated_tokens:,}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,85 @@
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.ai_engine import WaterFootprintAnalyzer
+from src.catalog import CATALOG, analysis_from_entry
+from src.models import WaterFootprintAnalysis
+
+
+# Shapes free-form Gemini output took before the response schema; with
+# response_mime_type/response_json_schema only "plain" (and truncation at the
+# token limit) can occur.
+VARIANTS = {
+    'plain': lambda body: body,
+    'fenced': lambda body: f"```json\n{body}\n```",
+    'prose + fence': lambda body: f"Here is the analysis:\n```json\n{body}\n```\nLet me know if you need more.",
+    'braces after': lambda body: f"{body}\n\nNote: figures use {{WFN 2024}} averages.",
+    'trailing comma': lambda body: body[:-1].rstrip() + ",\n}",
+    'truncated': lambda body: body[:len(body) * 3 // 4],
+}
+
+
+def legacy_parse(text):
+    # _parse_response before schema-constrained output, with the original regex extractor
+    text = text.strip()
+    for pattern in [r'```json\s*(\{.*?\})\s*```', r'```\s*(\{.*?\})\s*```', r'(\{.*\})']:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            try:
+                return WaterFootprintAnalysis(**json.loads(match.group(1).strip()))
+            except json.JSONDecodeError:
+                continue
+    return WaterFootprintAnalysis(**json.loads(text))
+
+
+def attempt(fn, text):
+    try:
+        fn(text)
+        return True
+    except Exception:
+        return False
+
+
+def timed(fn, texts, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            attempt(fn, text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1e6
+
+
+def run():
+    analyzer = WaterFootprintAnalyzer(api_key="bench", client=object(), use_cache=False)
+    bodies = [analysis_from_entry(entry).model_dump_json(indent=4) for entry in CATALOG]
+
+    def schema(text):
+        result = analyzer._parse_response(text)
+        if not isinstance(result, WaterFootprintAnalysis):
+            raise ValueError(result.error_type)
+
+    print(f"{len(bodies)} responses per variant, avg {sum(map(len, bodies)) / len(bodies):,.0f} chars")
+    for name, make in VARIANTS.items():
+        texts = [make(body) for body in bodies]
+        legacy_ok = sum(attempt(legacy_parse, t) for t in texts)
+        schema_ok = sum(attempt(schema, t) for t in texts)
+        print(f"{name:15s} legacy ok {legacy_ok:3d}/{len(texts)} {timed(legacy_parse, texts):7.1f}us  "
+              f"_parse_response ok {schema_ok:3d}/{len(texts)} {timed(schema, texts):7.1f}us")
+
+    # Unconstrained: every variant equally likely. Constrained: plain, plus the
+    # same truncation rate (max_output_tokens still applies).
+    unconstrained = [make(body) for make in VARIANTS.values() for body in bodies]
+    constrained = [body for _ in range(len(VARIANTS) - 1) for body in bodies] + [VARIANTS['truncated'](b) for b in bodies]
+    failures_before = sum(not attempt(legacy_parse, t) for t in unconstrained) / len(unconstrained)
+    failures_after = sum(not attempt(schema, t) for t in constrained) / len(constrained)
+    print(f"parse failures: unconstrained + legacy {failures_before:.1%}  constrained + schema {failures_after:.1%}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+import json
+import sys
+from pathlib import Path
+from unittest import mock
+
+import plotly.io as pio
+from plotly.basedatatypes import BaseFigure
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import visualizations
+from src.catalog import CATALOG, analysis_from_entry
+
+
+def charts(analysis):
+    return {
+        'gauge': lambda: visualizations.create_water_gauge(analysis.total_liters),
+        'donut': lambda: visualizations.create_water_breakdown_donut(analysis),
+        'carbon': lambda: visualizations.create_carbon_footprint_chart(analysis.carbon_kg,
+                                                                        analysis.sustainable_swap.carbon_kg),
+    }
+
+
+def check_hits_skip_serialization(analysis):
+    # A hit must neither serialize nor validate: only the miss pays for that
+    for name, draw in charts(analysis).items():
+        built = draw()
+        expected = json.loads(built.to_json())
+        with mock.patch.object(BaseFigure, 'to_dict', side_effect=AssertionError(f"{name}: to_dict on a hit")), \
+             mock.patch.object(BaseFigure, 'to_json', side_effect=AssertionError(f"{name}: to_json on a hit")), \
+             mock.patch.object(pio, 'to_json', side_effect=AssertionError(f"{name}: plotly.io.to_json on a hit")):
+            hit = draw()
+        assert json.loads(hit.to_json()) == expected, f"{name}: a hit draws a different figure"
+
+
+def check_hits_are_independent(analysis):
+    # Each caller gets its own figure; changing one leaves the cache alone
+    first = visualizations.create_water_gauge(analysis.total_liters)
+    second = visualizations.create_water_gauge(analysis.total_liters)
+    assert first is not second
+    second.update_layout(height=999)
+    second.add_annotation(text="changed")
+    third = visualizations.create_water_gauge(analysis.total_liters)
+    assert third.layout.height == first.layout.height and not third.layout.annotations
+
+
+def run():
+    analysis = analysis_from_entry(CATALOG[0])
+    check_hits_skip_serialization(analysis)
+    check_hits_are_independent(analysis)
+    print(f"cache hits neither serialize nor share figures: {visualizations.figure_cache_stats()}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src import cache
+from src.cache import LRUCache, ResultCache, SQLiteCache, get_near_duplicate_index
+from src.catalog import CATALOG, analysis_from_entry
+
+NAMESPACE = "gemini:v1"
+HIGH_BIT_HASH = 0xF0F0_1234_5678_9ABC  # above 2**63, stored as a negative integer
+
+# Runs in a fresh interpreter, i.e. after a restart with only the SQLite file left
+LOOKUP = """
+import sys
+sys.path.insert(0, {root!r})
+from src.cache import LRUCache, ResultCache, SQLiteCache, get_near_duplicate_index
+result_cache = ResultCache(LRUCache(), SQLiteCache({path!r}))
+match = get_near_duplicate_index({namespace!r}, result_cache).query({phash})
+print(match[0] if match else None, end='')
+"""
+
+
+def lookup_after_restart(path, namespace, phash):
+    code = LOOKUP.format(root=str(ROOT), path=str(path), namespace=namespace, phash=phash)
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+
+
+def check_index_survives_restart(path, analysis):
+    ResultCache(LRUCache(), SQLiteCache(path)).set("k-high", analysis, NAMESPACE, HIGH_BIT_HASH)
+    ResultCache(LRUCache(), SQLiteCache(path)).set("k-other", analysis, "other-model:v1", 0x1234)
+    near = HIGH_BIT_HASH ^ 0b101  # two bits away
+    assert lookup_after_restart(path, NAMESPACE, near) == "k-high"
+    # Entries from another model or prompt version must not be matched
+    assert lookup_after_restart(path, NAMESPACE, 0x1234) == "None"
+
+
+def check_expired_entries_are_skipped(path, analysis):
+    disk = SQLiteCache(path, ttl_seconds=60)
+    ResultCache(LRUCache(), disk).set("k-old", analysis, NAMESPACE, 0x42)
+    disk._conn().execute("UPDATE results SET created = ? WHERE key = 'k-old'", (time.time() - 120,))
+    assert "k-old" not in disk.hashes(NAMESPACE)[1]
+
+
+def check_old_files_are_migrated(path, analysis):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE results (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "created REAL NOT NULL, accessed REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO results VALUES ('k-legacy', ?, ?, ?)",
+                 (analysis.model_dump_json(), time.time(), time.time()))
+    conn.commit()
+    conn.close()
+    result_cache = ResultCache(LRUCache(), SQLiteCache(path))
+    assert result_cache.get("k-legacy") is not None
+    result_cache.set("k-new", analysis, NAMESPACE, 7)
+    assert result_cache.hashes(NAMESPACE) == ([7], ["k-new"])
+
+
+def run():
+    analysis = analysis_from_entry(CATALOG[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        check_index_survives_restart(Path(tmp) / "restart.sqlite3", analysis)
+        check_expired_entries_are_skipped(Path(tmp) / "ttl.sqlite3", analysis)
+        check_old_files_are_migrated(Path(tmp) / "legacy.sqlite3", analysis)
+        # In-process: a memory-only cache has nothing to reload
+        cache._near_duplicate_indexes.clear()
+        assert len(get_near_duplicate_index(NAMESPACE, ResultCache(LRUCache()))) == 0
+    print("near-duplicate index is rebuilt from the SQLite tier after a restart")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,158 @@
+import json
+import random
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.analytics import FleetPercentiles
+from src.catalog import CATALOG, analysis_from_entry
+from src.history import HistoryStore
+from src.sketches import KLLSketch
+
+
+FRACTIONS = np.linspace(0.01, 0.99, 99)
+
+
+def rank_error(sorted_values, fractions, estimates):
+    # Distance from each target fraction to the true rank range of its
+    # estimate; ties make that a range rather than a point
+    n = len(sorted_values)
+    below = np.searchsorted(sorted_values, estimates, side='left') / n
+    at_or_below = np.searchsorted(sorted_values, estimates, side='right') / n
+    return float(np.max(np.maximum(below - fractions, 0) + np.maximum(fractions - at_or_below, 0)))
+
+
+def random_stream(rng, n):
+    kind = rng.integers(3)
+    if kind == 0:
+        return rng.lognormal(7, 2, n)      # heavy-tailed, like liters per scan
+    if kind == 1:
+        return rng.uniform(0, 100, n)
+    # Few distinct values, like scans of the same catalog items
+    return rng.choice(np.array([entry.liters for entry in CATALOG]), n)
+
+
+def sketch_part(args):
+    # Runs in a worker process; only the serialized sketch comes back
+    values, seed = args
+    sketch = KLLSketch(200, seed)
+    for chunk in np.array_split(values, 7):
+        sketch.update_many(chunk)
+    return json.dumps(sketch.to_dict())
+
+
+def check_error_bounds(rng, trials=200):
+    errors = []
+    for trial in range(trials):
+        values = random_stream(rng, int(rng.integers(1_000, 200_000)))
+        sketch = KLLSketch(200, trial)
+        if trial % 4 == 0:
+            for value in values[:20_000]:
+                sketch.update(value)
+            values = values[:20_000]
+        else:
+            for chunk in np.array_split(values, int(rng.integers(1, 50))):
+                sketch.update_many(chunk)
+        errors.append(rank_error(np.sort(values), FRACTIONS, np.array(sketch.quantiles(FRACTIONS))))
+        assert sketch.quantile(0) == values.min() and sketch.quantile(1) == values.max()
+    errors = np.array(errors)
+    bound = KLLSketch(200).rank_error
+    within = np.mean(errors <= bound)
+    print(f"k=200, {trials} streams: rank error p50 {np.median(errors):.4f}  p99 {np.quantile(errors, 0.99):.4f}  "
+          f"max {errors.max():.4f}  (bound {bound:.4f}, {within:.1%} within)")
+    assert within >= 0.99, "rank error bound held for fewer than 99% of streams"
+
+
+def check_merge(rng, parts=8, n=400_000):
+    values = random_stream(rng, n)
+    with Pool(4) as pool:
+        serialized = pool.map(sketch_part, [(part, i) for i, part in enumerate(np.array_split(values, parts))])
+    merged = KLLSketch(200)
+    for blob in serialized:
+        merged.merge(KLLSketch.from_dict(json.loads(blob)))
+    assert merged.n == n
+    error = rank_error(np.sort(values), FRACTIONS, np.array(merged.quantiles(FRACTIONS)))
+    assert error <= merged.rank_error, error
+
+    restored = KLLSketch.from_dict(json.loads(json.dumps(merged.to_dict())))
+    assert restored.quantiles(FRACTIONS) == merged.quantiles(FRACTIONS)
+    size = len(json.dumps(merged.to_dict()))
+    print(f"{parts} worker processes x {n // parts:,} values merged: rank error {error:.4f}, "
+          f"{merged._retained} items retained, {size / 1024:.1f}KB as JSON; round-trip exact")
+
+
+def check_fleet(seed=0, users=2000):
+    rng = random.Random(seed)
+    pool = [analysis_from_entry(entry, quantity) for entry in CATALOG for quantity in (0.5, 1, 2)]
+    # One store with everyone, and the same users split across two workers' stores
+    store, shards = HistoryStore(':memory:'), [HistoryStore(':memory:'), HistoryStore(':memory:')]
+    for user in range(users):
+        for i in range(rng.randint(1, 30)):
+            analysis = rng.choice(pool)
+            store.add(f"user{user}", analysis, str(i))
+            shards[user % 2].add(f"user{user}", analysis, str(i))
+
+    fleet = FleetPercentiles.from_store(store)
+    merged = FleetPercentiles.from_dict(json.loads(json.dumps(FleetPercentiles.from_store(shards[0]).to_dict())))
+    merged.merge(FleetPercentiles.from_dict(json.loads(json.dumps(FleetPercentiles.from_store(shards[1]).to_dict()))))
+
+    by_user = {}
+    for user_id, category, items, liters in store.user_category_totals():
+        by_user.setdefault(user_id, {})[category] = (items, liters)
+    averages = np.sort([sum(l for _, l in c.values()) / sum(i for i, _ in c.values()) for c in by_user.values()])
+    liters = np.sort(np.concatenate([total_liters for total_liters, _ in store.scan_measures()]))
+    for label, sketches in (("from_store", fleet), ("merged shards", merged)):
+        worst = 0.0
+        for average in averages[::50]:
+            exact = np.searchsorted(averages, average, side='right') / len(averages)
+            worst = max(worst, abs(sketches.percentile('user_average', average) / 100 - exact))
+        assert worst <= sketches.users.rank_error, (label, worst)
+        error = rank_error(liters, FRACTIONS, np.array(sketches.scans['total_liters'].quantiles(FRACTIONS)))
+        assert error <= sketches.scans['total_liters'].rank_error, (label, error)
+        for category, sketch in sketches.user_categories.items():
+            exact = np.sort([c[category][1] for c in by_user.values() if category in c])
+            error = rank_error(exact, FRACTIONS, np.array(sketch.quantiles(FRACTIONS)))
+            assert error <= sketch.rank_error, (label, category, error)
+        print(f"{label:14s} {users} users, {len(liters):,} scans: user-average rank error {worst:.4f}, "
+              f"{len(sketches.user_categories)} category sketches within bound")
+
+
+def bench():
+    print(f"{'values':>10} | {'update_many':>11} {'update':>8} | {'quantiles':>9} {'np.sort':>9} | {'retained':>8}")
+    rng = np.random.default_rng(0)
+    for n in (10**4, 10**5, 10**6, 10**7):
+        values = rng.lognormal(7, 2, n)
+        sketch = KLLSketch(200)
+        started = time.perf_counter()
+        for chunk in np.array_split(values, max(n // 10_000, 1)):
+            sketch.update_many(chunk)
+        bulk_ns = (time.perf_counter() - started) / n * 1e9
+        single = KLLSketch(200)
+        started = time.perf_counter()
+        for value in values[:100_000].tolist():
+            single.update(value)
+        single_us = (time.perf_counter() - started) / min(n, 100_000) * 1e6
+        started = time.perf_counter()
+        sketch.quantiles(FRACTIONS)
+        query_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        np.quantile(values, FRACTIONS)
+        sort_ms = (time.perf_counter() - started) * 1000
+        print(f"{n:>10,} | {bulk_ns:9.0f}ns {single_us:6.1f}us | {query_ms:7.2f}ms {sort_ms:7.1f}ms | {sketch._retained:8}")
+
+
+def run(seed=0):
+    rng = np.random.default_rng(seed)
+    check_error_bounds(rng)
+    check_merge(rng)
+    check_fleet(seed)
+    bench()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,133 @@
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.analytics import DAY, HOUR, RollingAggregates
+from src.catalog import CATALOG, analysis_from_entry
+from src.history import ColumnarHistory
+
+
+NOW = 1_790_000_000.0
+
+
+def brute_force(columns, days, now, width, offset=0):
+    # The same window straight from the scans: buckets of `width` seconds,
+    # ending with the bucket that holds `now` (shifted back `offset` windows)
+    length = int(days * DAY // width)
+    last = math.floor(now / width) - offset * length
+    buckets = np.floor(columns['created'] / width)
+    mask = (buckets >= last - length + 1) & (buckets <= last)
+    carbon = columns['carbon_kg'][mask]
+    categories = {}
+    for code, liters in zip(columns['category'][mask], columns['total_liters'][mask]):
+        stats = categories.setdefault(columns.categories[code], {'items': 0, 'total_liters': 0.0})
+        stats['items'] += 1
+        stats['total_liters'] += liters
+    return {
+        'items': int(mask.sum()),
+        'total_liters': columns['total_liters'][mask].sum(),
+        'carbon_kg': carbon.sum(),
+        'swap_savings_liters': columns['swap_savings_liters'][mask].sum(),
+        'swap_carbon_kg': columns['swap_carbon_kg'][mask][carbon > 0].sum(),
+        'categories': categories,
+    }
+
+
+def same(label, actual, expected):
+    ok = actual['items'] == expected['items'] and all(
+        math.isclose(actual[k], expected[k], rel_tol=1e-9, abs_tol=1e-6)
+        for k in ('total_liters', 'carbon_kg', 'swap_savings_liters', 'swap_carbon_kg')
+    ) and sorted(actual['categories']) == sorted(expected['categories']) and all(
+        actual['categories'][c]['items'] == expected['categories'][c]['items']
+        and math.isclose(actual['categories'][c]['total_liters'], expected['categories'][c]['total_liters'], rel_tol=1e-9)
+        for c in expected['categories']
+    )
+    if not ok:
+        raise AssertionError(f"{label}:\n  buckets     {actual!r}\n  brute force {expected!r}")
+
+
+def check(aggregates, columns, now):
+    for days in (1, 7, 14, 30, 90, 365):
+        width = HOUR if days * DAY <= aggregates.rings[0].span else DAY
+        same(f"{days}d window at {now}", aggregates.window(days, now), brute_force(columns, days, now, width))
+    wow = aggregates.week_over_week(now)
+    same("this week", wow['current'], brute_force(columns, 7, now, HOUR))
+    same("last week", wow['previous'], brute_force(columns, 7, now, HOUR, offset=1))
+    trends = aggregates.category_trends(4, now)
+    for week, window in enumerate(aggregates.windows(7, 4, now)):
+        same(f"trend week {week}", window, brute_force(columns, 7, now, DAY, offset=3 - week))
+        for category, stats in window['categories'].items():
+            assert trends[category][week] == stats['total_liters']
+
+
+def run(seed=0, histories=200):
+    rng = random.Random(seed)
+    pool = [analysis_from_entry(entry, quantity) for entry in CATALOG for quantity in (0.5, 1, 2)]
+    queries = 0
+    for _ in range(histories):
+        # Scans spread over up to two years, some arriving out of order
+        span = rng.choice([3 * DAY, 40 * DAY, 2 * 365 * DAY])
+        n = rng.randint(0, 300)
+        created = sorted(NOW - rng.uniform(0, span) for _ in range(n))
+        for i in range(n // 10):
+            j = rng.randrange(n)
+            created[j] -= rng.uniform(0, 2 * DAY)
+        scans = [pool[rng.randrange(len(pool))] for _ in range(n)]
+
+        # Updated one scan at a time, and bulk-loaded part-way then updated
+        columns = ColumnarHistory.from_analyses(scans, created)
+        updated = RollingAggregates()
+        for analysis, ts in zip(scans, created):
+            updated.update(analysis, ts)
+        split = rng.randint(0, n)
+        loaded = RollingAggregates.from_columns(ColumnarHistory.from_analyses(scans[:split], created[:split]))
+        for analysis, ts in zip(scans[split:], created[split:]):
+            loaded.update(analysis, ts)
+
+        for now in (NOW, NOW + rng.uniform(0, 3 * DAY)):
+            check(updated, columns, now)
+            check(loaded, columns, now)
+            queries += 2
+    print(f"{histories} random histories, {queries} query sets: bucketed windows == brute force over scans")
+
+    print(f"{'scans':>9} | {'from_columns':>12} {'update':>8} | {'7d+30d':>8} {'wow':>8} {'trends':>8} | {'brute 30d':>9}")
+    for n in (10**3, 10**4, 10**5, 10**6):
+        rng = np.random.default_rng(n)
+        created = np.sort(NOW - rng.uniform(0, 3 * 365 * DAY, n))
+        columns = ColumnarHistory()
+        columns.extend_rows(
+            (float(ts), a.total_liters, a.carbon_kg, a.sustainable_swap.savings_liters,
+             a.sustainable_swap.carbon_kg, a.confidence_score, a.product_category)
+            for ts, a in zip(created, (pool[i % len(pool)] for i in range(n)))
+        )
+
+        started = time.perf_counter()
+        aggregates = RollingAggregates.from_columns(columns)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for i in range(1000):
+            aggregates.update(pool[i % len(pool)], NOW)
+        update_us = (time.perf_counter() - started) / 1000 * 1e6
+
+        def timed(fn, repeat=200):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            return (time.perf_counter() - started) / repeat * 1e6
+
+        rolling = timed(lambda: aggregates.rolling_totals(NOW))
+        wow = timed(lambda: aggregates.week_over_week(NOW))
+        trends = timed(lambda: aggregates.category_trends(4, NOW))
+        brute = timed(lambda: brute_force(columns, 30, NOW, DAY), repeat=3)
+        print(f"{n:>9,} | {load_ms:10.1f}ms {update_us:6.1f}us | {rolling:6.0f}us {wow:6.0f}us {trends:6.0f}us | {brute:7.0f}us")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,123 @@
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.catalog import CATALOG, analysis_from_entry
+from src.json_tools import extract_json_object
+
+
+WRAPPERS = [
+    lambda b: b,
+    lambda b: f"```json\n{b}\n```",
+    lambda b: f"```\n{b}\n```",
+    lambda b: f"Sure! Here is the analysis:\n\n{b}\n\nHope this helps.",
+    lambda b: f"Using {{WFN}} averages [see notes}}:\n{b}",
+    lambda b: f"{b}\nNote: values in {{liters}}, see {{\"src\": 1}}",
+    lambda b: f"[1, 2] {b} [3]",
+]
+
+ALPHABET = '{}[]",:\\ ab1\n'
+
+# An unrepairable truncated object before the real one must not hide it
+BROKEN_PREFIXES = [
+    'Note: {"a": b\n',
+    '{"draft": [1, 2\n',
+    'Before: {"x": {"y": nope, ',
+]
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(6 if depth < 4 else 4)
+    if kind == 0:
+        return rng.choice([True, False, None])
+    if kind == 1:
+        return rng.choice([0, -1, 2700, 3.5e-3, 1e21])
+    if kind in (2, 3):
+        return ''.join(rng.choice('ab{}[]",:\\/\n\tü💧 ') for _ in range(rng.randrange(12)))
+    if kind == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {str(random_value(rng, 4)) if rng.random() < 0.3 else f"k{i}": random_value(rng, depth + 1)
+            for i in range(rng.randrange(5))}
+
+
+def add_trailing_commas(body, rng):
+    # Insert "," before closers that follow a value, outside strings
+    out, in_string, escape = [], False, False
+    for i, c in enumerate(body):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '}]' and body[i - 1] not in '{[' and rng.random() < 0.5:
+            out.append(',')
+        out.append(c)
+    return ''.join(out)
+
+
+def consistent(partial, original):
+    # A repaired truncation may drop trailing elements but never invent or alter values
+    if isinstance(partial, dict):
+        return isinstance(original, dict) and all(k in original and consistent(v, original[k]) for k, v in partial.items())
+    if isinstance(partial, list):
+        return (isinstance(original, list) and len(partial) <= len(original)
+                and all(consistent(p, o) for p, o in zip(partial, original)))
+    return partial == original
+
+
+def check(label, text, expected=None, prefix_of=None):
+    try:
+        result = extract_json_object(text)
+    except json.JSONDecodeError:
+        if expected is not None:
+            raise AssertionError(f"{label}: failed to extract {text[:200]!r}")
+        return 'rejected'
+    if expected is not None and result != expected:
+        raise AssertionError(f"{label}: wrong object from {text[:200]!r}")
+    if prefix_of is not None and not consistent(result, prefix_of):
+        raise AssertionError(f"{label}: repair altered values in {text[:200]!r} -> {result!r}")
+    return 'ok'
+
+
+def run(seed=0, random_docs=2000, noise_docs=5000):
+    rng = random.Random(seed)
+    counts = {}
+
+    def tally(kind, outcome):
+        counts.setdefault(kind, {}).setdefault(outcome, 0)
+        counts[kind][outcome] += 1
+
+    tally('after broken', check('after broken', 'Note: {"a": b\n```json\n{"total_liters": 5}\n```',
+                                expected={'total_liters': 5}))
+    documents = [analysis_from_entry(entry).model_dump(mode='json') for entry in CATALOG]
+    documents += [{'doc': random_value(rng), 'n': i} for i in range(random_docs)]
+
+    for doc in documents:
+        for indent in (None, 2):
+            body = json.dumps(doc, indent=indent, ensure_ascii=rng.random() < 0.5)
+            for wrap in WRAPPERS:
+                tally('wrapped', check('wrapped', wrap(body), expected=doc))
+            tally('trailing commas', check('trailing commas', add_trailing_commas(body, rng), expected=doc))
+            for prefix in BROKEN_PREFIXES:
+                tally('after broken', check('after broken', f"{prefix}```json\n{body}\n```", expected=doc))
+            for cut in sorted(rng.sample(range(1, len(body)), min(40, len(body) - 1))):
+                tally('truncated', check('truncated', f"```json\n{body[:cut]}", prefix_of=doc))
+
+    for _ in range(noise_docs):
+        noise = ''.join(rng.choice(ALPHABET) for _ in range(rng.randrange(1, 200)))
+        tally('noise', check('noise', noise))
+
+    for kind, outcomes in counts.items():
+        print(f"{kind:16s} " + "  ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+    print("all invariants held")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,57 +1,34 @@
+import asyncio
 import json
-import re
+import hashlib
+import threading
+import time
 from pathlib import Path
-import base64
 
-from google import genai
+import httpx
 from google.genai import types
+from pydantic import ValidationError
 
 from .config import config
-from .models import WaterFootprintAnalysis, AnalysisError
+from .models import WaterFootprintAnalysis, AnalysisError, ModelRefusal, AnalysisResponse, analysis_response_schema
+from .catalog import render_reference_data, analyze_text as catalog_lookup
+from .cache import get_result_cache, get_near_duplicate_index, make_cache_key
+from .utils import perceptual_hash
+from .json_tools import IncrementalJSONParser, extract_json_object
+from .metrics import get_metrics
+from .context_cache import get_context_cache
+from .balancer import Endpoint, LoadBalancer, get_balancer
+from .client_pool import aio_client
+from .hedging import get_hedger
+from .resilience import CircuitOpenError, Deadline, DeadlineExceeded
+from .single_flight import AsyncSingleFlight, get_single_flight, process_lock
 
 
 SYSTEM_PROMPT = """You are an expert Environmental Scientist specialized in Virtual Water Footprints and Carbon Impact Analysis. Analyze products and provide comprehensive environmental impact estimates.
 
 ## Reference Data 
 
-### TEXTILES (per item)
-- Cotton T-shirt (250g): 2,700L water, 7kg CO2 (Green: 54%, Blue: 33%, Grey: 13%)
-- Pair of Jeans (800g): 8,000L water, 33kg CO2 (Green: 45%, Blue: 40%, Grey: 15%)
-- Leather Shoes: 8,000L water, 14kg CO2 (Green: 85%, Blue: 5%, Grey: 10%)
-- Polyester Shirt: 500L water, 5.5kg CO2 (Green: 10%, Blue: 60%, Grey: 30%)
-- Wool Sweater: 3,500L water, 27kg CO2 (Green: 78%, Blue: 12%, Grey: 10%)
-
-### FOOD & BEVERAGES (per kg unless specified)
-- Beef: 15,400L, 60kg CO2 (Green: 94%, Blue: 4%, Grey: 2%)
-- Chicken: 4,300L, 6kg CO2 (Green: 82%, Blue: 7%, Grey: 11%)
-- Pork: 6,000L, 12kg CO2 (Green: 82%, Blue: 8%, Grey: 10%)
-- Eggs (per egg): 200L, 0.2kg CO2 (Green: 79%, Blue: 7%, Grey: 14%)
-- Milk (per liter): 1,000L, 3kg CO2 (Green: 85%, Blue: 8%, Grey: 7%)
-- Cheese: 5,000L, 24kg CO2 (Green: 85%, Blue: 8%, Grey: 7%)
-- Rice: 2,500L, 4kg CO2 (Green: 48%, Blue: 44%, Grey: 8%)
-- Coffee (per cup): 140L, 0.2kg CO2 (Green: 96%, Blue: 1%, Grey: 3%)
-- Chocolate (100g): 1,700L, 0.6kg CO2 (Green: 98%, Blue: 1%, Grey: 1%)
-- Apple: 820L, 0.5kg CO2 (Green: 68%, Blue: 16%, Grey: 16%)
-- Banana: 790L, 0.7kg CO2 (Green: 84%, Blue: 12%, Grey: 4%)
-- Avocado: 1,981L, 0.85kg CO2 (Green: 60%, Blue: 30%, Grey: 10%)
-- Almonds: 16,000L, 5kg CO2 (Green: 40%, Blue: 50%, Grey: 10%)
-- Wine (1 glass): 110L, 0.3kg CO2 (Green: 70%, Blue: 16%, Grey: 14%)
-- Beer (1 pint): 150L, 0.3kg CO2 (Green: 85%, Blue: 5%, Grey: 10%)
-
-### ELECTRONICS
-- Smartphone: 13,000L, 85kg CO2 (Green: 10%, Blue: 70%, Grey: 20%)
-- Laptop: 190,000L, 340kg CO2 (Green: 8%, Blue: 72%, Grey: 20%)
-- Desktop Computer: 280,000L, 530kg CO2 (Green: 8%, Blue: 72%, Grey: 20%)
-- Television: 75,000L, 370kg CO2 (Green: 5%, Blue: 75%, Grey: 20%)
-- Tablet: 25,000L, 130kg CO2 (Green: 8%, Blue: 72%, Grey: 20%)
-
-### PAPER
-- A4 Paper (per sheet): 10 liters (Green: 60%, Blue: 25%, Grey: 15%)
-- Book (300 pages): 3,000 liters (Green: 60%, Blue: 25%, Grey: 15%)
-
-### VEHICLES
-- Car (average): 400,000 liters (Green: 5%, Blue: 80%, Grey: 15%)
-- Bicycle: 5,000 liters (Green: 20%, Blue: 60%, Grey: 20%)
+{reference_data}
 
 ## Water Types
 - Green Water: Rainwater consumed by plants
@@ -65,139 +42,395 @@ SYSTEM_PROMPT = """You are an expert Environmental Scientist specialized in Virt
 4. Suggest sustainable alternatives with real behavioral change potential
 5. Provide actionable personal steps and collective impact potential
 
-CRITICAL: Return ONLY a single valid JSON object. No markdown, no code blocks, no extra text.
-Start with { and end with }. Ensure all fields are complete and properly formatted.
-
-JSON Format:
-
-{
-    "product_name": "Product name",
-    "product_category": "Textiles/Food/Electronics/Agriculture/Paper/Transport/Other",
-    "total_liters": 0000,
-    "carbon_kg": 00.0,
-    "breakdown": {
-        "green_water_pct": 00.0,
-        "blue_water_pct": 00.0,
-        "grey_water_pct": 00.0
-    },
-    "sustainable_swap": {
-        "product_name": "Alternative",
-        "water_liters": 0000,
-        "carbon_kg": 00.0,
-        "savings_liters": 0000,
-        "savings_percentage": 00.0,
-        "reasoning": "Why this is better"
-    },
-    "regional_impact": {
-        "high_stress_regions": ["Region1", "Region2"],
-        "scarcity_multiplier": 1.0,
-        "context": "How this affects water-scarce areas"
-    },
-    "actionable_steps": [
-        "Specific action user can take",
-        "Another concrete step"
-    ],
-    "collective_impact": "If 1000 people switched, save X liters + Y kg CO2/year",
-    "confidence_score": 0.00,
-    "data_source": "WFN 2024 + IPCC Carbon Database",
-    "fun_fact": "Compelling environmental fact"
-}
-
-If image is unclear:
-{
-    "error": true,
-    "message": "Issue description",
-    "suggestion": "How to improve"
-}
-"""
+Respond with a single JSON object matching the response schema. If the image is unclear or shows
+no identifiable product, return the error object (error, message, suggestion) instead of an analysis.
+""".replace("{reference_data}", render_reference_data())
+
+RESPONSE_SCHEMA = analysis_response_schema()
+
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + json.dumps(RESPONSE_SCHEMA, sort_keys=True)).encode('utf-8')
+).hexdigest()[:12]
 
 
 class WaterFootprintAnalyzer:
-    def __init__(self, api_key=None):
-        self.api_key = api_key or config.GEMINI_API_KEY
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY is required. Set it in your .env file.")
-        self.client = genai.Client(api_key=self.api_key)
-        self.model_name = config.GEMINI_MODEL
+    def __init__(self, api_key=None, cache=None, use_cache=True, client=None, balancer=None, hedger=None):
+        # An explicit api_key or client (e.g. a stand-in for genai.Client in
+        # tests) pins a single endpoint; otherwise calls are spread over the
+        # configured key/model pool. Cache keys use the first (primary) model.
+        # Non-streaming calls are hedged when `hedger` is given or HEDGE_ENABLED.
+        if balancer is None:
+            if api_key or client is not None:
+                balancer = LoadBalancer([Endpoint(api_key or config.GEMINI_API_KEY, config.GEMINI_MODEL, client=client)])
+            else:
+                balancer = get_balancer()
+        self.balancer = balancer
+        primary = balancer.endpoints[0]
+        self.api_key = primary.api_key
+        self.model_name = primary.model_name
+        self.client = primary.client
+        self.hedger = hedger or (get_hedger() if config.HEDGE_ENABLED else None)
+        self.flights = get_single_flight()
+        self.cache = (cache or get_result_cache()) if use_cache else None
+        self.near_duplicates = None
+        self.cache_namespace = f"{self.model_name}:{PROMPT_VERSION}"
+        if self.cache is not None and config.NEAR_DUPLICATE_MAX_DISTANCE >= 0:
+            self.near_duplicates = get_near_duplicate_index(self.cache_namespace, self.cache)
     
     def _extract_json(self, text):
-        text = text.strip()
-        
-        json_patterns = [
-            r'```json\s*(\{.*?\})\s*```',
-            r'```\s*(\{.*?\})\s*```',
-            r'(\{.*\})',
-        ]
-        
-        for pattern in json_patterns:
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                json_str = match.group(1).strip()
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    continue
-        
         try:
-            return json.loads(text)
+            return extract_json_object(text)
         except json.JSONDecodeError as e:
             raise json.JSONDecodeError(
-                f"Failed to parse JSON from response. Raw text: {text[:500]}",
+                f"Failed to parse JSON from response. Raw text: {text.strip()[:500]}",
                 text, e.pos
             )
     
-    def analyze_image(self, image_data, mime_type="image/jpeg"):
+    def cache_key(self, image_data, mime_type="image/jpeg"):
+        return make_cache_key(image_data, mime_type, self.model_name, PROMPT_VERSION)
+    
+    def _lookup_cache(self, image_data, mime_type):
+        key = self.cache_key(image_data, mime_type)
+        cached = self.cache.get(key)
+        if cached is not None:
+            get_metrics().inc('cache_results_total', tier='exact', model=self.model_name)
+            return key, None, cached
+        
+        phash = perceptual_hash(image_data) if self.near_duplicates is not None else None
+        if phash is not None:
+            match = self.near_duplicates.query(phash)
+            if match is not None:
+                similar = self.cache.get(match[0])
+                if similar is not None:
+                    get_metrics().inc('cache_results_total', tier='near_duplicate', model=self.model_name)
+                    return key, phash, similar
+        get_metrics().inc('cache_results_total', tier='miss', model=self.model_name)
+        return key, phash, None
+    
+    def _store_cache(self, key, phash, result):
+        if isinstance(result, WaterFootprintAnalysis):
+            self.cache.set(key, result, self.cache_namespace, phash)
+            if phash is not None:
+                self.near_duplicates.add(phash, key)
+    
+    def _deadline(self, timeout):
+        # `timeout` is seconds for the whole analysis (None: API_TIMEOUT_SECONDS,
+        # 0: unbounded) or a Deadline the caller already started
+        if isinstance(timeout, Deadline):
+            return timeout
+        return Deadline(config.API_TIMEOUT_SECONDS if timeout is None else timeout)
+    
+    def analyze_image(self, image_data, mime_type="image/jpeg", timeout=None):
+        deadline = self._deadline(timeout)
+        if self.cache is None:
+            key, phash = self.cache_key(image_data, mime_type), None
+        else:
+            key, phash, cached = self._lookup_cache(image_data, mime_type)
+            if cached is not None:
+                return cached
+        
+        # Identical images already being analyzed wait for that call instead
         try:
-            img_b64 = base64.b64encode(image_data).decode('utf-8')
-            
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part(text=SYSTEM_PROMPT),
-                            types.Part(text="\n\nAnalyze this product image:"),
-                            types.Part(
-                                inline_data=types.Blob(
-                                    mime_type=mime_type,
-                                    data=img_b64
-                                )
-                            )
-                        ]
-                    )
-                ],
-                config=types.GenerateContentConfig(
-                    temperature=0.3,
-                    top_p=0.8,
-                    top_k=40,
-                    max_output_tokens=2048,
+            return self.flights.do(key, lambda: self._analyze_uncached(image_data, mime_type, key, phash, deadline),
+                                   deadline)
+        except DeadlineExceeded as e:
+            return self._error_from_exception(e)
+        except OSError as e:
+            return self._lock_error(e)
+    
+    def _analyze_uncached(self, image_data, mime_type, key, phash, deadline):
+        with process_lock(key, deadline) as lock:
+            cached = self._recheck_cache(key, lock)
+            if cached is not None:
+                return cached
+            result = self._call_model(image_data, mime_type, deadline)
+            if self.cache is not None:
+                self._store_cache(key, phash, result)
+            return result
+    
+    def _lock_error(self, e):
+        # The model call maps its own errors, so an OSError here came from
+        # opening the SINGLE_FLIGHT_LOCK_DIR lock file
+        return AnalysisError(
+            error_type="lock_error",
+            message=f"{type(e).__name__}: {e}",
+            user_friendly_message="⚠️ Couldn't open the analysis lock file. Check SINGLE_FLIGHT_LOCK_DIR.",
+            retry_suggested=False
+        )
+    
+    def _recheck_cache(self, key, lock):
+        # Having waited on another process's lock, its result is likely cached
+        if lock is None or not lock.waited or self.cache is None:
+            return None
+        return self.cache.get(key)
+    
+    def analyze_image_stream(self, image_data, mime_type="image/jpeg", timeout=None):
+        # Yields (fields, result): top-level fields parsed so far, then a final
+        # item whose result is the WaterFootprintAnalysis or AnalysisError.
+        # Closing the generator early closes the upstream stream.
+        deadline = self._deadline(timeout)
+        if self.cache is None:
+            key, phash = self.cache_key(image_data, mime_type), None
+        else:
+            key, phash, cached = self._lookup_cache(image_data, mime_type)
+            if cached is not None:
+                yield cached.model_dump(), cached
+                return
+        
+        # A follower of an identical in-flight analysis only gets the final result
+        call, leader = self.flights.join(key)
+        if not leader:
+            try:
+                result = call.wait(deadline)
+            except Exception as e:
+                result = self._error_from_exception(e)
+            yield (result.model_dump() if isinstance(result, WaterFootprintAnalysis) else {}), result
+            return
+        
+        parser = IncrementalJSONParser()
+        result = None
+        cached_elsewhere = False
+        try:
+            with process_lock(key, deadline) as lock:
+                result = self._recheck_cache(key, lock)
+                cached_elsewhere = result is not None
+                if not cached_elsewhere:
+                    started = time.perf_counter()
+                    request = usage = None
+                    try:
+                        # Retries and the context cache fallback only happen
+                        # before the first chunk, while nothing has been shown yet
+                        request, chunks = self._generate(
+                            self._image_parts(image_data, mime_type), deadline, self._open_stream
+                        )
+                        try:
+                            for chunk in chunks:
+                                deadline.check('parse')
+                                usage = getattr(chunk, 'usage_metadata', None) or usage
+                                if chunk.text and parser.feed(chunk.text):
+                                    yield dict(parser.fields), None
+                        finally:
+                            chunks.close()
+                        result = self._parse_response(parser.text)
+                    except Exception as e:
+                        result = self._error_from_exception(e)
+                    self._record_call('stream', request, started, usage, result)
+                    
+                    if self.cache is not None:
+                        self._store_cache(key, phash, result)
+        except DeadlineExceeded as e:
+            result = self._error_from_exception(e)
+        except OSError as e:
+            result = self._lock_error(e)
+        finally:
+            error = None if result is not None else RuntimeError("Streaming analysis was abandoned")
+            self.flights.finish(key, call, result, error)
+        
+        fields = result.model_dump() if cached_elsewhere else dict(parser.fields)
+        yield fields, result
+    
+    def cache_stats(self):
+        if self.cache is None:
+            return None
+        stats = self.cache.stats()
+        if self.near_duplicates is not None:
+            stats['near_duplicates'] = self.near_duplicates.stats()
+        return stats
+    
+    def _image_parts(self, image_data, mime_type):
+        # Blob base64-encodes raw bytes itself when the request is serialized
+        return [
+            types.Part(text="Analyze this product image:"),
+            types.Part(
+                inline_data=types.Blob(
+                    mime_type=mime_type,
+                    data=image_data
                 )
             )
-            
-            if not response.text:
-                return AnalysisError(
-                    error_type="empty_response",
-                    message="Empty response from AI",
-                    user_friendly_message="Couldn't analyze the image. Try a clearer photo with better lighting.",
-                    retry_suggested=True
-                )
-            
-            result = self._extract_json(response.text)
-            
-            if result.get("error"):
-                return AnalysisError(
-                    error_type="analysis_failed",
-                    message=result.get("message", "Unknown error"),
-                    user_friendly_message=result.get("suggestion", "Try with a clearer image."),
-                    retry_suggested=True
-                )
-            
-            return WaterFootprintAnalysis(**result)
-            
+        ]
+    
+    def _text_parts(self, name, quantity):
+        return [types.Part(text=f"Analyze this product (quantity: {quantity:g}): {name}")]
+    
+    def _request_for(self, parts, model_name=None, cached_content=None):
+        # The system prompt is static, so it goes in system_instruction or, when
+        # context caching is on, is referenced by its server-side cache handle.
+        return dict(
+            model=model_name or self.model_name,
+            contents=[types.Content(role="user", parts=parts)],
+            config=types.GenerateContentConfig(
+                system_instruction=None if cached_content else SYSTEM_PROMPT,
+                cached_content=cached_content,
+                temperature=0.3,
+                top_p=0.8,
+                top_k=40,
+                max_output_tokens=2048,
+                response_mime_type="application/json",
+                response_json_schema=RESPONSE_SCHEMA,
+            )
+        )
+    
+    def _context_cache(self, endpoint):
+        if not config.CONTEXT_CACHE_ENABLED:
+            return None
+        return get_context_cache(
+            endpoint.client, endpoint.api_key, endpoint.model_name, SYSTEM_PROMPT, config.CONTEXT_CACHE_TTL_SECONDS
+        )
+    
+    def _context_cache_failed(self, context_cache, request, error):
+        # A rejected or expired cache handle should not fail the analysis: drop
+        # it and let the caller resend with the instruction inline.
+        if not request['config'].cached_content or 'cache' not in str(error).lower():
+            return False
+        context_cache.invalidate()
+        return True
+    
+    def _generate(self, parts, deadline, send=None):
+        # Routes the call through the balancer, failing over to another
+        # endpoint when one is rate limited, unhealthy or rejects its key
+        send = send or (lambda client, request: client.models.generate_content(**request))
+        tried = []
+        while True:
+            endpoint = self.balancer.acquire(exclude=tried)
+            started = time.perf_counter()
+            error = None
+            try:
+                return self._generate_on(endpoint, parts, send, deadline)
+            except Exception as e:
+                error = e
+                tried.append(endpoint)
+                if len(tried) >= len(self.balancer.endpoints) or not self.balancer.should_fail_over(e):
+                    raise
+            finally:
+                self.balancer.release(endpoint, time.perf_counter() - started, error)
+    
+    def _generate_hedged(self, parts, deadline):
+        # Hedged copies go over the async client so the loser can be cancelled
+        if self.hedger is None:
+            return self._generate(parts, deadline)
+        return self.hedger.call(lambda: self._generate_async(parts, deadline))
+    
+    async def _generate_async(self, parts, deadline):
+        tried = []
+        while True:
+            endpoint = self.balancer.acquire(exclude=tried)
+            started = time.perf_counter()
+            error = None
+            try:
+                return await self._generate_on_async(endpoint, parts, deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                tried.append(endpoint)
+                if len(tried) >= len(self.balancer.endpoints) or not self.balancer.should_fail_over(e):
+                    raise
+            finally:
+                self.balancer.release(endpoint, time.perf_counter() - started, error)
+    
+    def _generate_on(self, endpoint, parts, send, deadline):
+        context_cache = self._context_cache(endpoint)
+        request = self._request_for(parts, endpoint.model_name, context_cache.name() if context_cache else None)
+        try:
+            return request, endpoint.guard.call(lambda: self._send(send, endpoint.client, request, deadline), deadline)
+        except Exception as e:
+            if not self._context_cache_failed(context_cache, request, e):
+                raise
+        request = self._request_for(parts, endpoint.model_name)
+        return request, endpoint.guard.call(lambda: self._send(send, endpoint.client, request, deadline), deadline)
+    
+    def _with_timeout(self, request, deadline):
+        # Each attempt gets the remaining budget as its HTTP timeout; genai also
+        # sends it as X-Server-Timeout so the server stops working on it too
+        remaining = deadline.remaining()
+        if remaining is None:
+            return request
+        timeout_ms = max(1, int(remaining * 1000))
+        return {**request, 'config': request['config'].model_copy(update={
+            'http_options': types.HttpOptions(timeout=timeout_ms)
+        })}
+    
+    def _send(self, send, client, request, deadline):
+        try:
+            return send(client, self._with_timeout(request, deadline))
+        except httpx.TimeoutException as e:
+            raise deadline.exceeded('call') from e
+    
+    async def _generate_on_async(self, endpoint, parts, deadline):
+        context_cache = self._context_cache(endpoint)
+        name = await asyncio.to_thread(context_cache.name) if context_cache is not None else None
+        request = self._request_for(parts, endpoint.model_name, name)
+        try:
+            return request, await endpoint.guard.call_async(
+                lambda: self._send_async(endpoint.client, request, deadline), deadline
+            )
+        except Exception as e:
+            if not self._context_cache_failed(context_cache, request, e):
+                raise
+        request = self._request_for(parts, endpoint.model_name)
+        return request, await endpoint.guard.call_async(
+            lambda: self._send_async(endpoint.client, request, deadline), deadline
+        )
+    
+    async def _send_async(self, client, request, deadline):
+        try:
+            return await aio_client(client).models.generate_content(**self._with_timeout(request, deadline))
+        except httpx.TimeoutException as e:
+            raise deadline.exceeded('call') from e
+    
+    def _open_stream(self, client, request):
+        # Pulls the first chunk so connection and quota errors surface here
+        stream = iter(client.models.generate_content_stream(**request))
+        first = next(stream, None)
+        
+        def chunks():
+            try:
+                if first is not None:
+                    yield first
+                    yield from stream
+            finally:
+                close = getattr(stream, 'close', None)
+                if close is not None:
+                    close()
+        return chunks()
+    
+    def _parse_response(self, text):
+        if not text:
+            return AnalysisError(
+                error_type="empty_response",
+                message="Empty response from AI",
+                user_friendly_message="Couldn't analyze the image. Try a clearer photo with better lighting.",
+                retry_suggested=True
+            )
+        
+        # Schema-constrained output validates in one pass; anything else (stub
+        # clients, fenced or prose-wrapped JSON) goes through the extractor.
+        started = time.perf_counter()
+        path = 'schema'
+        try:
+            try:
+                result = AnalysisResponse.validate_json(text)
+            except ValidationError:
+                path = 'fallback'
+                result = self._parse_unconstrained(text)
+        finally:
+            get_metrics().observe('parse_seconds', time.perf_counter() - started, model=self.model_name, path=path)
+        
+        if isinstance(result, ModelRefusal):
+            return AnalysisError(
+                error_type="analysis_failed",
+                message=result.message,
+                user_friendly_message=result.suggestion,
+                retry_suggested=True
+            )
+        return result
+    
+    def _parse_unconstrained(self, text):
+        try:
+            result = self._extract_json(text)
         except json.JSONDecodeError as e:
             error_details = f"JSON error at position {e.pos}: {str(e)}"
-            response_preview = response.text[:300] if 'response' in locals() and hasattr(response, 'text') else 'No response'
+            response_preview = text[:300]
             
             return AnalysisError(
                 error_type="parse_error",
@@ -205,50 +438,229 @@ class WaterFootprintAnalyzer:
                 user_friendly_message="AI response format error. Retrying might help.",
                 retry_suggested=True
             )
+        
+        if result.get("error"):
+            return ModelRefusal(
+                error=True,
+                message=result.get("message", "Unknown error"),
+                suggestion=result.get("suggestion", "Try with a clearer image.")
+            )
+        
+        return WaterFootprintAnalysis(**result)
+    
+    def _error_from_exception(self, e):
+        error_msg = str(e)
+        error_type_name = type(e).__name__
+        
+        # Detailed error classification
+        if isinstance(e, CircuitOpenError):
+            friendly = f"🚧 Gemini is failing right now. Try again in {max(e.retry_in, 1):.0f}s."
+            error_type = "circuit_open"
+        elif isinstance(e, (TimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+            friendly = "⏱️ Request timed out. Try again with smaller image."
+            error_type = "timeout"
+        elif "API_KEY" in error_msg.upper() or "401" in error_msg or "unauthorized" in error_msg.lower():
+            friendly = "🔑 Invalid API key. Check your GEMINI_API_KEY in .env file"
+            error_type = "auth_error"
+        elif "quota" in error_msg.lower() or "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+            friendly = "🚦 API rate limit exceeded. Wait a minute and try again."
+            error_type = "rate_limit"
+        elif "404" in error_msg or "not found" in error_msg.lower():
+            friendly = f"❌ Model '{self.model_name}' not available. Try gemini-2.5-flash"
+            error_type = "model_not_found"
+        elif "timeout" in error_msg.lower():
+            friendly = "⏱️ Request timed out. Try again with smaller image."
+            error_type = "timeout"
+        elif "network" in error_msg.lower() or "connection" in error_msg.lower():
+            friendly = "🌐 Network error. Check your internet connection."
+            error_type = "network_error"
+        else:
+            friendly = f"⚠️ API Error: {error_msg[:200]}"
+            error_type = "api_error"
+        
+        return AnalysisError(
+            error_type=error_type,
+            message=f"{error_type_name}: {error_msg}",
+            user_friendly_message=friendly,
+            retry_suggested=True
+        )
+    
+    def _record_call(self, kind, request, started, usage, result):
+        metrics = get_metrics()
+        model = request['model'] if request is not None else self.model_name
+        labels = dict(model=model, prompt_version=PROMPT_VERSION, kind=kind)
+        outcome = 'ok' if isinstance(result, WaterFootprintAnalysis) else result.error_type
+        
+        metrics.inc('requests_total', outcome=outcome, **labels)
+        metrics.observe('latency_seconds', time.perf_counter() - started, **labels)
+        if request is not None:
+            metrics.observe('request_bytes', request_payload_bytes(request), **labels)
+        if usage is None:
+            return
+        
+        prompt_tokens = usage.prompt_token_count or 0
+        output_tokens = (usage.candidates_token_count or 0) + (getattr(usage, 'thoughts_token_count', None) or 0)
+        image_tokens = sum(
+            d.token_count or 0 for d in (usage.prompt_tokens_details or [])
+            if 'IMAGE' in str(d.modality).upper()
+        )
+        metrics.observe('prompt_tokens', prompt_tokens, **labels)
+        metrics.observe('cached_tokens', getattr(usage, 'cached_content_token_count', None) or 0, **labels)
+        metrics.observe('image_tokens', image_tokens, **labels)
+        metrics.observe('output_tokens', output_tokens, **labels)
+        metrics.observe('cost_usd', (
+            prompt_tokens * config.GEMINI_INPUT_USD_PER_MTOK +
+            output_tokens * config.GEMINI_OUTPUT_USD_PER_MTOK
+        ) / 1_000_000, **labels)
+    
+    def _call_model(self, image_data, mime_type, deadline):
+        started = time.perf_counter()
+        request = response = None
+        try:
+            request, response = self._generate_hedged(self._image_parts(image_data, mime_type), deadline)
+            result = self._parse_response(response.text)
         except Exception as e:
-            error_msg = str(e)
-            error_type_name = type(e).__name__
-            
-            # Detailed error classification
-            if "API_KEY" in error_msg.upper() or "401" in error_msg or "unauthorized" in error_msg.lower():
-                friendly = "🔑 Invalid API key. Check your GEMINI_API_KEY in .env file"
-                error_type = "auth_error"
-            elif "quota" in error_msg.lower() or "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                friendly = "🚦 API rate limit exceeded. Wait a minute and try again."
-                error_type = "rate_limit"
-            elif "404" in error_msg or "not found" in error_msg.lower():
-                friendly = f"❌ Model '{self.model_name}' not available. Try gemini-2.5-flash"
-                error_type = "model_not_found"
-            elif "timeout" in error_msg.lower():
-                friendly = "⏱️ Request timed out. Try again with smaller image."
-                error_type = "timeout"
-            elif "network" in error_msg.lower() or "connection" in error_msg.lower():
-                friendly = "🌐 Network error. Check your internet connection."
-                error_type = "network_error"
-            else:
-                friendly = f"⚠️ API Error: {error_msg[:200]}"
-                error_type = "api_error"
-            
+            result = self._error_from_exception(e)
+        self._record_call('image', request, started, getattr(response, 'usage_metadata', None), result)
+        return result
+    
+    def analyze_from_file(self, file_path, timeout=None):
+        path = Path(file_path)
+        with open(path, 'rb') as f:
+            return self.analyze_image(f.read(), mime_type_for_path(path), timeout=timeout)
+    
+    def analyze_text(self, name, quantity=1, timeout=None):
+        if not quantity > 0:
             return AnalysisError(
-                error_type=error_type,
-                message=f"{error_type_name}: {error_msg}",
-                user_friendly_message=friendly,
-                retry_suggested=True
+                error_type="invalid_quantity",
+                message=f"Quantity must be positive, got {quantity!r}",
+                user_friendly_message="Enter a quantity greater than zero.",
+                retry_suggested=False
             )
+        result = catalog_lookup(name, quantity)
+        if result is not None:
+            return result
+        
+        started = time.perf_counter()
+        request = response = None
+        try:
+            request, response = self._generate_hedged(self._text_parts(name, quantity), self._deadline(timeout))
+            result = self._parse_response(response.text)
+        except Exception as e:
+            result = self._error_from_exception(e)
+        self._record_call('text', request, started, getattr(response, 'usage_metadata', None), result)
+        return result
+
+
+class AsyncWaterFootprintAnalyzer(WaterFootprintAnalyzer):
+    def __init__(self, api_key=None, cache=None, use_cache=True, max_concurrency=None, client=None, balancer=None,
+                 hedger=None):
+        super().__init__(api_key=api_key, cache=cache, use_cache=use_cache, client=client, balancer=balancer,
+                         hedger=hedger)
+        self.max_concurrency = max_concurrency or config.ASYNC_MAX_CONCURRENCY
+        self._loop_state = {}
+        self.in_flight = 0
     
-    def analyze_from_file(self, file_path):
-        path = Path(file_path)
-        mime_types = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
-        mime_type = mime_types.get(path.suffix.lower(), 'image/jpeg')
+    def _loop_local(self):
+        # asyncio primitives belong to the loop that first uses them, so each
+        # event loop gets its own semaphore and single-flight table (dropped
+        # once the loop is closed): the analyzer can serve several
+        # asyncio.run() batches, but max_concurrency and coalescing apply
+        # per loop
+        loop = asyncio.get_running_loop()
+        for closed in [l for l in self._loop_state if l.is_closed()]:
+            del self._loop_state[closed]
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = self._loop_state[loop] = (asyncio.Semaphore(self.max_concurrency), AsyncSingleFlight())
+        return state
+    
+    async def analyze_image(self, image_data, mime_type="image/jpeg", timeout=None):
+        # Cancelling the awaiting task (or hitting `timeout`, by default
+        # API_TIMEOUT_SECONDS) cancels the upstream call and releases the
+        # concurrency slot; CancelledError is re-raised.
+        deadline = self._deadline(timeout)
+        try:
+            return await asyncio.wait_for(self._analyze_image_async(image_data, mime_type, deadline), deadline.remaining())
+        except DeadlineExceeded as e:
+            return self._error_from_exception(e)
+        except asyncio.TimeoutError:
+            return self._error_from_exception(deadline.exceeded('call'))
+    
+    async def _analyze_image_async(self, image_data, mime_type, deadline):
+        if self.cache is None:
+            key, phash = self.cache_key(image_data, mime_type), None
+        else:
+            key, phash, cached = await asyncio.to_thread(self._lookup_cache, image_data, mime_type)
+            if cached is not None:
+                return cached
         
-        with open(path, 'rb') as f:
-            return self.analyze_image(f.read(), mime_type)
+        return await self._loop_local()[1].do(
+            key, lambda: self._analyze_uncached_async(image_data, mime_type, key, phash, deadline)
+        )
+    
+    async def _analyze_uncached_async(self, image_data, mime_type, key, phash, deadline):
+        result = await self._call_model_async(image_data, mime_type, deadline)
+        if self.cache is not None:
+            await asyncio.to_thread(self._store_cache, key, phash, result)
+        return result
+    
+    async def _call_model_async(self, image_data, mime_type, deadline):
+        async with self._loop_local()[0]:
+            self.in_flight += 1
+            started = time.perf_counter()
+            request = response = None
+            try:
+                request, response = await self._generate_hedged_async(self._image_parts(image_data, mime_type), deadline)
+                result = self._parse_response(response.text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = self._error_from_exception(e)
+            finally:
+                self.in_flight -= 1
+            self._record_call('async', request, started, getattr(response, 'usage_metadata', None), result)
+            return result
+    
+    async def _generate_hedged_async(self, parts, deadline):
+        if self.hedger is None:
+            return await self._generate_async(parts, deadline)
+        return await self.hedger.call_async(lambda: self._generate_async(parts, deadline))
+    
+    async def analyze_from_file(self, file_path, timeout=None):
+        path = Path(file_path)
+        image_data = await asyncio.to_thread(path.read_bytes)
+        return await self.analyze_image(image_data, mime_type_for_path(path), timeout=timeout)
+    
+    async def analyze_many(self, items, timeout=None):
+        return await asyncio.gather(*(
+            self.analyze_image(image_data, mime_type, timeout=timeout)
+            for image_data, mime_type in items
+        ))
+
+
+def request_payload_bytes(request):
+    total = len((request['config'].system_instruction or '').encode('utf-8'))
+    for content in request['contents']:
+        for part in content.parts:
+            if part.text:
+                total += len(part.text.encode('utf-8'))
+            if part.inline_data is not None:
+                total += 4 * -(-len(part.inline_data.data) // 3)
+    return total
+
+
+def mime_type_for_path(path):
+    mime_types = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+    return mime_types.get(Path(path).suffix.lower(), 'image/jpeg')
 
 
 _analyzer = None
+_analyzer_lock = threading.Lock()
 
 def get_analyzer():
     global _analyzer
-    if _analyzer is None:
-        _analyzer = WaterFootprintAnalyzer()
-    return _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = WaterFootprintAnalyzer()
+        return _analyzer
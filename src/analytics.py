@@ -1,65 +1,93 @@
-from datetime import datetime, timedelta
-from typing import List
-from collections import defaultdict
+import time
+from itertools import groupby
+from typing import List, Union
+
+import numpy as np
+
+from .history import ColumnarHistory
+from .sketches import KLLSketch, load_json, save_json
+
+
+HIGH_WATER_LITERS = 5000
+HOUR = 3600
+DAY = 86400
+
+
+def _running_total(values):
+    # Left-to-right float64 sum, bit-identical to a running total or sum();
+    # np.sum's pairwise order can differ in the last bit, which flips
+    # threshold checks such as the 0.6 average-confidence tip
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+def _summary(items, total_water, total_carbon, categories, top_category, potential_savings, carbon_savings):
+    return {
+        'total_items': items,
+        'total_water': total_water,
+        'total_carbon': total_carbon,
+        'avg_water_per_item': total_water / items,
+        'avg_carbon_per_item': total_carbon / items,
+        'top_category': top_category,
+        'potential_savings_water': potential_savings,
+        'potential_savings_carbon': carbon_savings,
+        'category_breakdown': categories
+    }
+
+
+def _patterns(items, last_category, last_category_count, high_water_items, confidence_total):
+    if items < 3:
+        return []
+    
+    patterns = []
+    if last_category_count >= 3:
+        patterns.append(f"You scan a lot of {last_category} items - consider bulk alternatives to reduce impact")
+    if high_water_items >= 2:
+        patterns.append(f"You've scanned {high_water_items} high-water items - small swaps = huge impact")
+    if confidence_total / items < 0.6:
+        patterns.append("Tip: Better lighting & closer photos = more accurate analysis")
+    return patterns
 
 
 class TrendAnalyzer:
-    def __init__(self, history: List):
+    def __init__(self, history: Union[List, ColumnarHistory]):
+        # Accepts analyses or a ColumnarHistory; all statistics are computed
+        # column-wise with NumPy
         self.history = history
+        self.columns = history if isinstance(history, ColumnarHistory) else ColumnarHistory.from_analyses(history)
     
     def get_weekly_summary(self):
-        if not self.history:
+        columns = self.columns
+        if not len(columns):
             return None
         
-        total_water = sum(a.total_liters for a in self.history)
-        total_carbon = sum(getattr(a, 'carbon_kg', 0) for a in self.history)
-        
-        categories = defaultdict(int)
-        for analysis in self.history:
-            categories[analysis.product_category] += 1
-        
-        top_category = max(categories.items(), key=lambda x: x[1])[0] if categories else "None"
-        
-        avg_water = total_water / len(self.history)
-        avg_carbon = total_carbon / len(self.history)
-        
-        potential_savings = sum(a.sustainable_swap.savings_liters for a in self.history)
-        carbon_savings = sum(getattr(a.sustainable_swap, 'carbon_kg', 0) for a in self.history 
-                           if getattr(a, 'carbon_kg', 0) > 0)
-        
-        return {
-            'total_items': len(self.history),
-            'total_water': total_water,
-            'total_carbon': total_carbon,
-            'avg_water_per_item': avg_water,
-            'avg_carbon_per_item': avg_carbon,
-            'top_category': top_category,
-            'potential_savings_water': potential_savings,
-            'potential_savings_carbon': carbon_savings,
-            'category_breakdown': dict(categories)
-        }
+        carbon = columns['carbon_kg']
+        categories = columns.category_counts()
+        return _summary(
+            len(columns),
+            _running_total(columns['total_liters']),
+            _running_total(carbon),
+            categories,
+            max(categories.items(), key=lambda x: x[1])[0],
+            _running_total(columns['swap_savings_liters']),
+            _running_total(columns['swap_carbon_kg'][carbon > 0])
+        )
     
     def detect_patterns(self):
-        if len(self.history) < 3:
+        columns = self.columns
+        if len(columns) < 3:
             return []
         
-        patterns = []
-        
-        categories = [a.product_category for a in self.history]
-        if categories.count(categories[-1]) >= 3:
-            patterns.append(f"You scan a lot of {categories[-1]} items - consider bulk alternatives to reduce impact")
-        
-        high_water_items = [a for a in self.history if a.total_liters > 5000]
-        if len(high_water_items) >= 2:
-            patterns.append(f"You've scanned {len(high_water_items)} high-water items - small swaps = huge impact")
-        
-        avg_confidence = sum(a.confidence_score for a in self.history) / len(self.history)
-        if avg_confidence < 0.6:
-            patterns.append("Tip: Better lighting & closer photos = more accurate analysis")
-        
-        return patterns
+        codes = columns['category']
+        return _patterns(
+            len(columns),
+            columns.categories[codes[-1]],
+            int(np.count_nonzero(codes == codes[-1])),
+            int(np.count_nonzero(columns['total_liters'] > HIGH_WATER_LITERS)),
+            _running_total(columns['confidence'])
+        )
     
-    def get_milestone_progress(self, total_water: float):
+    @staticmethod
+    def get_milestone_progress(total_water: float):
         milestones = [
             (10000, "🌱 Beginner", "First 10K liters tracked"),
             (50000, "💧 Conscious", "50K liters analyzed"),
@@ -93,10 +121,303 @@ class TrendAnalyzer:
         }
 
 
+class TimeBuckets:
+    # Fixed-width time buckets (e.g. hours) in a ring of `size` slots. Each
+    # slot remembers which absolute bucket it holds, so a slot is reset when
+    # time wraps around to it and stale slots are skipped by queries: memory
+    # and query cost depend on the window, never on how long history is.
+    FIELDS = ('items', 'total_liters', 'carbon_kg', 'swap_savings_liters', 'swap_carbon_kg')
+
+    def __init__(self, width, size):
+        self.width = width
+        self.size = size
+        self.epochs = np.full(size, -1, np.int64)
+        self.values = np.zeros((size, len(self.FIELDS)))
+        self.category_items = np.zeros((size, 0))
+        self.category_liters = np.zeros((size, 0))
+
+    @property
+    def span(self):
+        return self.width * self.size
+
+    def _grow_categories(self, count):
+        extra = count - self.category_items.shape[1]
+        if extra > 0:
+            padding = np.zeros((self.size, max(extra, 8)))
+            self.category_items = np.hstack([self.category_items, padding])
+            self.category_liters = np.hstack([self.category_liters, padding])
+
+    def add(self, created, row, code):
+        bucket = int(created // self.width)
+        slot = bucket % self.size
+        if self.epochs[slot] != bucket:
+            if self.epochs[slot] > bucket:
+                return  # older than anything the ring still holds
+            self.epochs[slot] = bucket
+            self.values[slot] = 0
+            self.category_items[slot] = 0
+            self.category_liters[slot] = 0
+        self._grow_categories(code + 1)
+        self.values[slot] += row
+        self.category_items[slot, code] += 1
+        self.category_liters[slot, code] += row[1]
+
+    def load(self, created, rows, codes, categories):
+        # Bulk load of one scan per row; only the newest `size` buckets are kept
+        if not len(created):
+            return
+        buckets = (created // self.width).astype(np.int64)
+        keep = buckets > max(buckets.max(), self.epochs.max()) - self.size
+        buckets, rows, codes = buckets[keep], rows[keep], codes[keep]
+        slots = buckets % self.size
+        stale = np.unique(slots[self.epochs[slots] != buckets])
+        self.values[stale] = 0
+        self._grow_categories(categories)
+        self.category_items[stale] = 0
+        self.category_liters[stale] = 0
+        self.epochs[slots] = buckets
+        np.add.at(self.values, slots, rows)
+        np.add.at(self.category_items, (slots, codes), 1)
+        np.add.at(self.category_liters, (slots, codes), rows[:, 1])
+
+    def window(self, first, last):
+        # Sums over absolute buckets first..last inclusive
+        if last - first + 1 > self.size:
+            raise ValueError(f"window of {last - first + 1} buckets exceeds ring of {self.size}")
+        buckets = np.arange(first, last + 1)
+        slots = buckets % self.size
+        live = slots[self.epochs[slots] == buckets]
+        return self.values[live].sum(0), self.category_items[live].sum(0), self.category_liters[live].sum(0)
+
+
+class RollingAggregates:
+    # Hourly and daily totals per scan timestamp (UTC), for "last 7 days"
+    # style questions: rolling totals, week-over-week deltas and per-category
+    # trends are summed from at most a few hundred precomputed buckets, so
+    # they cost the same after years of scans as after a week. A window uses
+    # the hourly ring when it fits (the current hour plus the hours before
+    # it), otherwise whole UTC days up to and including today.
+    def __init__(self, hours=24 * 14, days=400):
+        self.rings = (TimeBuckets(HOUR, hours), TimeBuckets(DAY, days))
+        self.categories = []
+        self._codes = {}
+
+    def category_code(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def add(self, created, total_liters, carbon_kg, swap_savings_liters, swap_carbon_kg, category):
+        # Swap carbon only counts for scans with a carbon figure, as in the summary
+        row = np.array([1, total_liters, carbon_kg, swap_savings_liters, swap_carbon_kg if carbon_kg > 0 else 0])
+        code = self.category_code(category)
+        for ring in self.rings:
+            ring.add(created, row, code)
+
+    def update(self, analysis, created=None):
+        self.add(
+            created if created is not None else time.time(),
+            analysis.total_liters,
+            getattr(analysis, 'carbon_kg', 0) or 0,
+            analysis.sustainable_swap.savings_liters,
+            getattr(analysis.sustainable_swap, 'carbon_kg', 0) or 0,
+            analysis.product_category
+        )
+
+    @classmethod
+    def from_columns(cls, columns, hours=24 * 14, days=400):
+        aggregates = cls(hours, days)
+        for category in columns.categories:
+            aggregates.category_code(category)
+        carbon = columns['carbon_kg']
+        rows = np.column_stack([
+            np.ones(len(columns)), columns['total_liters'], carbon,
+            columns['swap_savings_liters'], np.where(carbon > 0, columns['swap_carbon_kg'], 0)
+        ])
+        for ring in aggregates.rings:
+            ring.load(columns['created'], rows, columns['category'].astype(np.intp), len(columns.categories))
+        return aggregates
+
+    def windows(self, days=7, periods=1, now=None):
+        # `periods` consecutive windows of `days` each, oldest first
+        now = time.time() if now is None else now
+        for ring in self.rings:
+            if days * periods * DAY <= ring.span:
+                break
+        else:
+            raise ValueError(f"{periods} x {days} days is longer than the daily ring keeps")
+        length = int(days * DAY // ring.width)
+        last = int(now // ring.width)
+        result = []
+        for period in reversed(range(periods)):
+            end = last - period * length
+            values, category_items, category_liters = ring.window(end - length + 1, end)
+            window = dict(zip(TimeBuckets.FIELDS, values.tolist()))
+            window['items'] = int(window['items'])
+            window['categories'] = {
+                category: {'items': int(category_items[code]), 'total_liters': float(category_liters[code])}
+                for code, category in enumerate(self.categories) if category_items[code]
+            }
+            result.append(window)
+        return result
+
+    def window(self, days=7, now=None):
+        return self.windows(days, 1, now)[0]
+
+    def rolling_totals(self, now=None):
+        return {days: self.window(days, now) for days in (7, 30)}
+
+    def summary(self, days=7, now=None):
+        # Same shape as TrendAnalyzer.get_weekly_summary, over the window only
+        window = self.window(days, now)
+        if not window['items']:
+            return None
+        categories = {category: stats['items'] for category, stats in window['categories'].items()}
+        return _summary(
+            window['items'], window['total_liters'], window['carbon_kg'], categories,
+            max(categories.items(), key=lambda x: x[1])[0],
+            window['swap_savings_liters'], window['swap_carbon_kg']
+        )
+
+    def week_over_week(self, now=None):
+        previous, current = self.windows(7, 2, now)
+        change = current['total_liters'] - previous['total_liters']
+        categories = list(dict.fromkeys([*previous['categories'], *current['categories']]))
+        return {
+            'current': current,
+            'previous': previous,
+            'delta_items': current['items'] - previous['items'],
+            'delta_liters': change,
+            'delta_carbon': current['carbon_kg'] - previous['carbon_kg'],
+            'delta_pct': 100 * change / previous['total_liters'] if previous['total_liters'] else None,
+            'category_deltas': {
+                category: current['categories'].get(category, {}).get('total_liters', 0.0)
+                - previous['categories'].get(category, {}).get('total_liters', 0.0)
+                for category in categories
+            }
+        }
+
+    def category_trends(self, weeks=4, now=None):
+        # {category: [liters per week, oldest first]} for the last `weeks` weeks
+        windows = self.windows(7, weeks, now)
+        categories = list(dict.fromkeys(c for window in windows for c in window['categories']))
+        return {
+            category: [window['categories'].get(category, {}).get('total_liters', 0.0) for window in windows]
+            for category in categories
+        }
+
+
+class FleetPercentiles:
+    # Fleet-wide distributions kept in KLL sketches instead of sorted
+    # histories: per-scan total_liters and carbon_kg, each user's average
+    # liters per scan, and each user's total liters per category. Sketches
+    # from workers that saw disjoint scans (and disjoint users, for the
+    # per-user sketches) merge into one; all of it round-trips through JSON.
+    SCAN_METRICS = ('total_liters', 'carbon_kg')
+
+    def __init__(self, k=200):
+        self.k = k
+        self.scans = {metric: KLLSketch(k) for metric in self.SCAN_METRICS}
+        self.users = KLLSketch(k)
+        self.user_categories = {}
+
+    def observe_scans(self, total_liters, carbon_kg):
+        self.scans['total_liters'].update_many(total_liters)
+        self.scans['carbon_kg'].update_many(carbon_kg)
+
+    def observe_scan(self, analysis):
+        self.scans['total_liters'].update(analysis.total_liters)
+        self.scans['carbon_kg'].update(getattr(analysis, 'carbon_kg', 0) or 0)
+
+    def observe_user(self, category_totals):
+        # One call per user with {category: (items, total_liters)}
+        items = sum(count for count, _ in category_totals.values())
+        if not items:
+            return
+        self.users.update(sum(liters for _, liters in category_totals.values()) / items)
+        for category, (_, liters) in category_totals.items():
+            if category not in self.user_categories:
+                self.user_categories[category] = KLLSketch(self.k)
+            self.user_categories[category].update(liters)
+
+    @classmethod
+    def from_store(cls, store, k=200):
+        # One streaming pass over the scans and one grouped query per user
+        fleet = cls(k)
+        for total_liters, carbon_kg in store.scan_measures():
+            fleet.observe_scans(total_liters, carbon_kg)
+        for _, rows in groupby(store.user_category_totals(), key=lambda row: row[0]):
+            fleet.observe_user({category: (items, liters) for _, category, items, liters in rows})
+        return fleet
+
+    def merge(self, other):
+        for metric in self.SCAN_METRICS:
+            self.scans[metric].merge(other.scans[metric])
+        self.users.merge(other.users)
+        for category, sketch in other.user_categories.items():
+            self.user_categories.setdefault(category, KLLSketch(self.k)).merge(sketch)
+        return self
+
+    def percentile(self, metric, value, category=None):
+        # Share (0-100) of the fleet at or below `value`. `metric` is a scan
+        # metric, 'user_average' or 'user_category' (with `category`)
+        rank = self._sketch(metric, category).rank(value)
+        return None if rank is None else 100 * rank
+
+    def distribution(self, metric, fractions=(0.1, 0.25, 0.5, 0.75, 0.9), category=None):
+        return dict(zip(fractions, self._sketch(metric, category).quantiles(fractions)))
+
+    def water_conscious_rank(self, average_liters):
+        # "Top N%": the share of users whose average scan is as light or lighter
+        if len(self.users) == 0:
+            return None
+        return max(self.percentile('user_average', average_liters), 100 / len(self.users))
+
+    def _sketch(self, metric, category=None):
+        if metric == 'user_average':
+            return self.users
+        if metric == 'user_category':
+            return self.user_categories.get(category) or KLLSketch(self.k)
+        return self.scans[metric]
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'scans': {metric: sketch.to_dict() for metric, sketch in self.scans.items()},
+            'users': self.users.to_dict(),
+            'user_categories': {category: sketch.to_dict() for category, sketch in self.user_categories.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        fleet = cls(data['k'])
+        fleet.scans = {metric: KLLSketch.from_dict(sketch) for metric, sketch in data['scans'].items()}
+        fleet.users = KLLSketch.from_dict(data['users'])
+        fleet.user_categories = {
+            category: KLLSketch.from_dict(sketch) for category, sketch in data['user_categories'].items()
+        }
+        return fleet
+
+    def save(self, path):
+        save_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_dict(load_json(path))
+
+
 class ChallengeEngine:
     @staticmethod
     def generate_weekly_challenge(history):
-        if not history:
+        stats = TrendAnalyzer(history).get_weekly_summary() if len(history) else None
+        return ChallengeEngine.challenge_for(stats)
+    
+    @staticmethod
+    def challenge_for(stats):
+        # `stats` is a weekly summary (from either analyzer), None before the first scan
+        if stats is None:
             return {
                 'title': '🎯 First Scan Challenge',
                 'description': 'Scan 5 products this week to understand your impact',
@@ -105,8 +426,6 @@ class ChallengeEngine:
                 'reward': 'Unlock trend analysis'
             }
         
-        stats = TrendAnalyzer(history).get_weekly_summary()
-        
         if stats['top_category'] == 'Food':
             return {
                 'title': '🥗 Plant-Based Week',
@@ -0,0 +1,156 @@
+import threading
+import time
+
+from .config import config
+from .client_pool import get_client
+from .metrics import get_metrics
+from .resilience import CircuitOpenError, endpoint_label, get_request_guard, is_retryable, retry_hint
+
+
+STRATEGIES = ('least_loaded', 'weighted_round_robin')
+LATENCY_SMOOTHING = 0.2
+
+
+def parse_weighted(spec):
+    # "a,b:2,c:0.5" -> [("a", 1.0), ("b", 2.0), ("c", 0.5)]
+    items = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition(':')
+        items.append((name.strip(), float(weight) if weight else 1.0))
+    return items
+
+
+class Endpoint:
+    # One API key + model pair. Shares the process-wide client and request
+    # guard (rate limit, breaker) for that pair with every other analyzer.
+    def __init__(self, api_key, model_name, weight=1.0, client=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.weight = weight
+        self.label = endpoint_label(api_key, model_name)
+        self.client = client or get_client(api_key)
+        self.guard = get_request_guard(api_key, model_name)
+        self.in_flight = 0
+        self.latency = None         # EWMA of successful call latency, seconds
+        self.ejected_until = 0.0
+        self.current_weight = 0.0   # smooth weighted round-robin state
+
+    def healthy(self, now):
+        return now >= self.ejected_until and self.guard.breaker.state != 'open'
+
+    def headroom(self):
+        # Fraction of the rate-limit burst currently available (1.0 if unlimited)
+        bucket = self.guard.bucket
+        return 1.0 if bucket is None else max(bucket.available(), 0.0) / bucket.capacity
+
+    def quota_wait(self):
+        bucket = self.guard.bucket
+        return 0.0 if bucket is None else max(0.0, (1 - bucket.available()) / bucket.rate)
+
+
+class LoadBalancer:
+    # Routes each call to one endpoint: least_loaded picks the lowest expected
+    # wait (rate-limit delay + queued work at its observed latency, scaled by
+    # weight); weighted_round_robin spreads calls in proportion to weight.
+    # Endpoints whose key is rejected or out of quota sit out `eject_seconds`,
+    # and those with an open circuit are skipped until it closes.
+    def __init__(self, endpoints, strategy='least_loaded', eject_seconds=60.0):
+        if not endpoints:
+            raise ValueError("At least one API key and model are required")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            healthy = [e for e in candidates if e.healthy(now)] or candidates
+            if self.strategy == 'weighted_round_robin':
+                endpoint = self._next_round_robin(healthy)
+            else:
+                endpoint = min(healthy, key=self._expected_wait)
+            endpoint.in_flight += 1
+        get_metrics().set('endpoint_in_flight', endpoint.in_flight, endpoint=endpoint.label)
+        return endpoint
+
+    def release(self, endpoint, latency, error=None):
+        metrics = get_metrics()
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.latency = latency if endpoint.latency is None else (
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * endpoint.latency
+                )
+            else:
+                reason = self._ejection_reason(error)
+                if reason is not None:
+                    hint = retry_hint(error) if reason == 'quota' else None
+                    endpoint.ejected_until = time.monotonic() + (hint or self.eject_seconds)
+                    metrics.inc('endpoint_ejections_total', endpoint=endpoint.label, reason=reason)
+        metrics.set('endpoint_in_flight', endpoint.in_flight, endpoint=endpoint.label)
+        metrics.set('endpoint_headroom', endpoint.headroom(), endpoint=endpoint.label)
+        if error is None:
+            metrics.observe('endpoint_latency_seconds', latency, endpoint=endpoint.label)
+
+    def should_fail_over(self, error):
+        return isinstance(error, CircuitOpenError) or is_retryable(error) or self._ejection_reason(error) == 'auth'
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'endpoint': e.label,
+                'weight': e.weight,
+                'in_flight': e.in_flight,
+                'latency_s': e.latency,
+                'headroom': e.headroom(),
+                'healthy': e.healthy(now),
+                'circuit': e.guard.breaker.state,
+            } for e in self.endpoints]
+
+    def _expected_wait(self, endpoint):
+        known = [e.latency for e in self.endpoints if e.latency is not None]
+        latency = endpoint.latency if endpoint.latency is not None else (min(known) if known else 1.0)
+        return endpoint.quota_wait() + (endpoint.in_flight + 1) * latency / endpoint.weight
+
+    def _next_round_robin(self, endpoints):
+        total = sum(e.weight for e in endpoints)
+        for e in endpoints:
+            e.current_weight += e.weight
+        chosen = max(endpoints, key=lambda e: e.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def _ejection_reason(self, error):
+        code = getattr(error, 'code', None)
+        if code in (401, 403):
+            return 'auth'
+        if code == 429 or 'RESOURCE_EXHAUSTED' in str(error):
+            return 'quota'
+        return None
+
+
+def endpoints_from_config():
+    keys = parse_weighted(config.GEMINI_API_KEYS) or ([(config.GEMINI_API_KEY, 1.0)] if config.GEMINI_API_KEY else [])
+    if not keys:
+        raise ValueError("GEMINI_API_KEY is required. Set it in your .env file.")
+    models = parse_weighted(config.GEMINI_MODELS) or [(config.GEMINI_MODEL, 1.0)]
+    return [Endpoint(key, model, key_weight * model_weight) for key, key_weight in keys for model, model_weight in models]
+
+
+_balancer = None
+_balancer_lock = threading.Lock()
+
+def get_balancer():
+    global _balancer
+    with _balancer_lock:
+        if _balancer is None:
+            _balancer = LoadBalancer(endpoints_from_config(), config.ROUTING_STRATEGY, config.ENDPOINT_EJECT_SECONDS)
+        return _balancer
@@ -0,0 +1,172 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from .ai_engine import WaterFootprintAnalyzer
+from .config import config
+from .models import WaterFootprintAnalysis
+from .metrics import get_metrics
+from .resilience import Deadline, DeadlineExceeded
+from .utils import prepare_image
+
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+def discover_images(source):
+    source = Path(source)
+    if source.is_dir():
+        return sorted(p for p in source.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES and p.is_file())
+
+    # Manifest: one path per line, or JSONL with a "path" field; relative to the manifest
+    paths = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                line = json.loads(line)['path']
+            path = Path(line)
+            paths.append(path if path.is_absolute() else source.parent / path)
+    return paths
+
+
+def load_completed(output_path):
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from an interrupted run
+            if record.get('status') == 'ok':
+                completed.add(record['path'])
+    return completed
+
+
+def analyze_path(analyzer, path, max_dim, timeout=None):
+    # One deadline covers resizing, encoding, the model call and parsing
+    started = time.perf_counter()
+    deadline = Deadline(config.API_TIMEOUT_SECONDS if timeout is None else timeout)
+    record = {'path': str(path)}
+    try:
+        prepared, err = prepare_image(path.read_bytes(), max_dim=max_dim, deadline=deadline)
+        if err:
+            record.update(status='error', error={'error_type': 'invalid_image', 'message': err})
+        else:
+            record.update(bytes_saved=prepared.bytes_saved, tokens_saved=prepared.tokens_saved)
+            result = analyzer.analyze_image(prepared.data, prepared.mime_type, timeout=deadline)
+            if isinstance(result, WaterFootprintAnalysis):
+                record.update(status='ok', result=result.model_dump())
+            else:
+                record.update(status='error', error=result.model_dump())
+    except DeadlineExceeded as e:
+        record.update(status='error', error={'error_type': 'timeout', 'message': str(e)})
+    except OSError as e:
+        record.update(status='error', error={'error_type': 'io_error', 'message': str(e)})
+    record['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+class Progress:
+    def __init__(self, total, stream=sys.stderr, interval=0.5):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, ok):
+        with self._lock:
+            self.done += 1
+            self.errors += 0 if ok else 1
+            now = time.perf_counter()
+            if now - self._last >= self.interval or self.done == self.total:
+                self._last = now
+                self.render(now)
+
+    def render(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        error_pct = 100 * self.errors / self.done if self.done else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        self.stream.write(
+            f"\r{self.done}/{self.total} | {rate:.1f} img/s | errors {self.errors} ({error_pct:.1f}%) | ETA {eta:.0f}s "
+        )
+        self.stream.flush()
+
+
+def run_batch(source, output, workers=8, max_dim=None, use_cache=True, analyzer=None, timeout=None):
+    output = Path(output)
+    paths = discover_images(source)
+    completed = load_completed(output)
+    pending = [p for p in paths if str(p) not in completed]
+
+    print(f"{len(paths)} images found, {len(paths) - len(pending)} already done, {len(pending)} to analyze",
+          file=sys.stderr)
+    if not pending:
+        return 0, 0
+
+    analyzer = analyzer or WaterFootprintAnalyzer(use_cache=use_cache)
+    progress = Progress(len(pending))
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_path, analyzer, path, max_dim, timeout) for path in pending]
+        try:
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                progress.update(record['status'] == 'ok')
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+
+    print(file=sys.stderr)
+    return progress.done, progress.errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description="Headless batch water footprint analysis")
+    parser.add_argument("source", help="Directory of images or manifest file (one path or JSON object per line)")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL output; completed files are skipped on restart")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Concurrent analyses")
+    parser.add_argument("--max-dim", type=int, default=None, help="Longest image edge sent to the model (default: MODEL_IMAGE_MAX_DIM)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the result cache")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds per image, including resize (default: API_TIMEOUT_SECONDS, 0 = none)")
+    parser.add_argument("--metrics-out", help="Write token/cost/latency metrics here on exit (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args(argv)
+
+    try:
+        done, errors = run_batch(args.source, args.output, args.workers, args.max_dim, not args.no_cache,
+                                 timeout=args.timeout)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume.", file=sys.stderr)
+        return 130
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.metrics_out:
+            metrics = get_metrics()
+            text = metrics.to_prometheus() if args.metrics_out.endswith('.prom') else metrics.to_json(indent=2)
+            Path(args.metrics_out).write_text(text, encoding='utf-8')
+
+    return 1 if done and errors == done else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
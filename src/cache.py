@@ -0,0 +1,389 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+
+from .config import config
+from .models import WaterFootprintAnalysis
+
+
+def make_cache_key(image_data, mime_type, model_name, prompt_version):
+    digest = hashlib.sha256()
+    for part in (mime_type, model_name, prompt_version):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(image_data)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_size=256, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+                del self._items[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._items[key] = (value, stored_at or time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            'size': len(self._items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class SQLiteCache:
+    def __init__(self, path, max_rows=10_000, ttl_seconds=None):
+        self.path = Path(path)
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed)")
+        # Perceptual hashes live next to their entries so the near-duplicate
+        # index can be rebuilt after a restart; older files gain the columns
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        for column, kind in (('namespace', 'TEXT'), ('phash', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE results ADD COLUMN {column} {kind}")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # WAL lets several Streamlit worker processes read while one writes
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def get(self, key):
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            value, created = row
+            now = time.time()
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._count('expirations')
+                self._count('misses')
+                return None
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value, created
+
+    def set(self, key, value, namespace=None, phash=None):
+        now = time.time()
+        if phash is not None and phash >= 1 << 63:
+            phash -= 1 << 64  # SQLite integers are signed 64-bit
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created, accessed, namespace, phash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, now, now, namespace, phash)
+            )
+            cursor = conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed "
+                "LIMIT MAX(0, (SELECT COUNT(*) FROM results) - ?))",
+                (self.max_rows,)
+            )
+            if cursor.rowcount > 0:
+                self._count('evictions', cursor.rowcount)
+        except sqlite3.Error:
+            pass
+
+    def hashes(self, namespace):
+        # (phashes, keys) of the live entries stored with a hash under `namespace`
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        try:
+            rows = self._conn().execute(
+                "SELECT phash, key FROM results WHERE namespace = ? AND phash IS NOT NULL AND created >= ?",
+                (namespace, cutoff)
+            ).fetchall()
+        except sqlite3.Error:
+            return [], []
+        return [phash & 0xFFFFFFFFFFFFFFFF for phash, _ in rows], [key for _, key in rows]
+
+    def clear(self):
+        self._conn().execute("DELETE FROM results")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats(self):
+        return {
+            'size': len(self),
+            'max_size': self.max_rows,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class ResultCache:
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return None
+        row = self.disk.get(key)
+        if row is None:
+            return None
+        payload, created = row
+        try:
+            value = WaterFootprintAnalysis.model_validate_json(payload)
+        except ValueError:
+            return None
+        self.memory.set(key, value, stored_at=created)
+        return value
+
+    def set(self, key, analysis, namespace=None, phash=None):
+        self.memory.set(key, analysis)
+        if self.disk is not None:
+            self.disk.set(key, analysis.model_dump_json(), namespace, phash)
+
+    def hashes(self, namespace):
+        # Only the disk tier outlives the process, so only it is worth reloading
+        return self.disk.hashes(namespace) if self.disk is not None else ([], [])
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        memory = self.memory.stats()
+        disk = self.disk.stats() if self.disk is not None else None
+        hits = memory['hits'] + (disk['hits'] if disk else 0)
+        lookups = memory['hits'] + memory['misses']
+        return {
+            'memory': memory,
+            'disk': disk,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+
+def _popcount64(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class HammingIndex:
+    # Multi-index hashing: a 64-bit hash is split into four 16-bit chunks. If two
+    # hashes are within distance r, at least one chunk is within r // 4, so only
+    # buckets near the query's chunks need to be probed.
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, max_distance=6, rebuild_threshold=4096):
+        self.max_distance = max_distance
+        self.rebuild_threshold = rebuild_threshold
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._values = []
+        self._pending = []
+        self._order = None
+        self._offsets = None
+        self._masks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, phash, value):
+        with self._lock:
+            self._pending.append(phash)
+            self._values.append(value)
+            if len(self._pending) >= max(self.rebuild_threshold, len(self._hashes) // 8):
+                self._rebuild()
+
+    def add_many(self, hashes, values):
+        with self._lock:
+            self._pending.extend(int(h) for h in hashes)
+            self._values.extend(values)
+            self._rebuild()
+
+    def _rebuild(self):
+        pending = np.array(self._pending, dtype=np.uint64)
+        self._hashes = np.concatenate([self._hashes, pending])
+        self._pending = []
+        n = len(self._hashes)
+        buckets = 1 << self.CHUNK_BITS
+        orders, offsets = [], []
+        for j in range(self.CHUNKS):
+            chunk = ((self._hashes >> np.uint64(j * self.CHUNK_BITS)) & np.uint64(buckets - 1)).astype(np.int64)
+            orders.append(np.argsort(chunk, kind='stable'))
+            counts = np.bincount(chunk, minlength=buckets)
+            offsets.append(np.concatenate([[0], np.cumsum(counts)]) + j * n)
+        self._order = np.concatenate(orders)
+        self._offsets = np.stack(offsets)
+
+    def _flip_masks(self, radius):
+        if radius not in self._masks:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for bits in combinations(range(self.CHUNK_BITS), r):
+                    masks.append(sum(1 << b for b in bits))
+            self._masks[radius] = np.array(masks, dtype=np.int64)
+        return self._masks[radius]
+
+    def _candidates(self, phash, radius):
+        masks = self._flip_masks(radius)
+        starts, ends = [], []
+        for j in range(self.CHUNKS):
+            chunk = (phash >> (j * self.CHUNK_BITS)) & ((1 << self.CHUNK_BITS) - 1)
+            probes = chunk ^ masks
+            starts.append(self._offsets[j][probes])
+            ends.append(self._offsets[j][probes + 1])
+        starts = np.concatenate(starts)
+        lengths = np.concatenate(ends) - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return self._order[positions]
+
+    def query(self, phash, max_distance=None):
+        max_distance = self.max_distance if max_distance is None else max_distance
+        best = None
+        with self._lock:
+            target = np.uint64(phash)
+            if len(self._hashes):
+                ids = self._candidates(phash, max_distance // self.CHUNKS)
+                if len(ids):
+                    distances = _popcount64(self._hashes[ids] ^ target)
+                    i = int(np.argmin(distances))
+                    if distances[i] <= max_distance:
+                        best = (int(ids[i]), int(distances[i]))
+            if self._pending:
+                distances = _popcount64(np.array(self._pending, dtype=np.uint64) ^ target)
+                i = int(np.argmin(distances))
+                if distances[i] <= max_distance and (best is None or distances[i] < best[1]):
+                    best = (len(self._hashes) + i, int(distances[i]))
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._values[best[0]], best[1]
+
+    def stats(self):
+        return {
+            'size': len(self._values),
+            'max_distance': self.max_distance,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            memory = LRUCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL_SECONDS or None)
+            disk = None
+            if config.RESULT_CACHE_PATH:
+                try:
+                    disk = SQLiteCache(
+                        os.path.expanduser(config.RESULT_CACHE_PATH),
+                        config.RESULT_CACHE_DISK_ROWS,
+                        config.RESULT_CACHE_TTL_SECONDS or None
+                    )
+                except (sqlite3.Error, OSError):
+                    disk = None
+            _result_cache = ResultCache(memory, disk)
+        return _result_cache
+
+
+_near_duplicate_indexes = {}
+
+def get_near_duplicate_index(namespace, cache=None):
+    # The first caller for a namespace seeds the index with the hashes its
+    # cache has on disk, so near-duplicate hits survive a restart
+    with _result_cache_lock:
+        if namespace not in _near_duplicate_indexes:
+            index = HammingIndex(config.NEAR_DUPLICATE_MAX_DISTANCE)
+            hashes, keys = cache.hashes(namespace) if cache is not None else ([], [])
+            if keys:
+                index.add_many(hashes, keys)
+            _near_duplicate_indexes[namespace] = index
+        return _near_duplicate_indexes[namespace]
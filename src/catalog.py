@@ -0,0 +1,288 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from .models import WaterFootprintAnalysis, WaterBreakdown, SustainableSwap
+
+
+CATALOG_VERSION = "2024.2"
+# The reference figures are per-category averages without a per-entry
+# citation, so a catalog answer is shown as medium confidence (the model's
+# own answers carry theirs)
+CATALOG_SOURCE = "reference averages from the analysis prompt"
+CATALOG_CONFIDENCE = 0.6
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    name: str
+    category: str
+    liters: float
+    carbon_kg: Optional[float]
+    green_pct: float
+    blue_pct: float
+    grey_pct: float
+    qualifier: str = ""
+    aliases: Tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def label(self):
+        return f"{self.name} ({self.qualifier})" if self.qualifier else self.name
+
+
+@dataclass(frozen=True)
+class CatalogSwap:
+    name: str
+    liters: float
+    carbon_kg: float
+    reasoning: str
+
+
+# (heading, line style, entries) - rendered verbatim into SYSTEM_PROMPT
+REFERENCE_SECTIONS = [
+    ("TEXTILES (per item)", "water", [
+        CatalogEntry("Cotton T-shirt", "Textiles", 2700, 7, 54, 33, 13, "250g", ("t-shirt", "tshirt", "tee", "cotton shirt")),
+        CatalogEntry("Pair of Jeans", "Textiles", 8000, 33, 45, 40, 15, "800g", ("jeans", "denim", "denim jeans")),
+        CatalogEntry("Leather Shoes", "Textiles", 8000, 14, 85, 5, 10, "", ("shoes", "leather boots")),
+        CatalogEntry("Polyester Shirt", "Textiles", 500, 5.5, 10, 60, 30, "", ("polyester", "synthetic shirt")),
+        CatalogEntry("Wool Sweater", "Textiles", 3500, 27, 78, 12, 10, "", ("sweater", "jumper", "wool jumper")),
+    ]),
+    ("FOOD & BEVERAGES (per kg unless specified)", "short", [
+        CatalogEntry("Beef", "Food", 15400, 60, 94, 4, 2, "", ("steak", "ground beef", "minced beef")),
+        CatalogEntry("Chicken", "Food", 4300, 6, 82, 7, 11, "", ("chicken breast", "poultry")),
+        CatalogEntry("Pork", "Food", 6000, 12, 82, 8, 10, "", ("bacon", "ham")),
+        CatalogEntry("Eggs", "Food", 200, 0.2, 79, 7, 14, "per egg", ("egg",)),
+        CatalogEntry("Milk", "Food", 1000, 3, 85, 8, 7, "per liter", ("cow milk", "dairy milk")),
+        CatalogEntry("Cheese", "Food", 5000, 24, 85, 8, 7, "", ("cheddar",)),
+        CatalogEntry("Rice", "Food", 2500, 4, 48, 44, 8, "", ("white rice", "brown rice")),
+        CatalogEntry("Coffee", "Food", 140, 0.2, 96, 1, 3, "per cup", ("cup of coffee", "espresso", "latte")),
+        CatalogEntry("Chocolate", "Food", 1700, 0.6, 98, 1, 1, "100g", ("chocolate bar",)),
+        CatalogEntry("Apple", "Food", 820, 0.5, 68, 16, 16, "", ()),
+        CatalogEntry("Banana", "Food", 790, 0.7, 84, 12, 4, "", ()),
+        CatalogEntry("Avocado", "Food", 1981, 0.85, 60, 30, 10, "", ()),
+        CatalogEntry("Almonds", "Food", 16000, 5, 40, 50, 10, "", ("almond",)),
+        CatalogEntry("Wine", "Food", 110, 0.3, 70, 16, 14, "1 glass", ("glass of wine", "red wine", "white wine")),
+        CatalogEntry("Beer", "Food", 150, 0.3, 85, 5, 10, "1 pint", ("pint of beer", "lager")),
+    ]),
+    ("ELECTRONICS", "short", [
+        CatalogEntry("Smartphone", "Electronics", 13000, 85, 10, 70, 20, "", ("phone", "mobile phone", "iphone", "cell phone")),
+        CatalogEntry("Laptop", "Electronics", 190000, 340, 8, 72, 20, "", ("laptop computer", "notebook computer", "macbook")),
+        CatalogEntry("Desktop Computer", "Electronics", 280000, 530, 8, 72, 20, "", ("desktop", "pc")),
+        CatalogEntry("Television", "Electronics", 75000, 370, 5, 75, 20, "", ("tv",)),
+        CatalogEntry("Tablet", "Electronics", 25000, 130, 8, 72, 20, "", ("ipad",)),
+    ]),
+    ("PAPER", "liters", [
+        CatalogEntry("A4 Paper", "Paper", 10, None, 60, 25, 15, "per sheet", ("sheet of paper", "printer paper")),
+        CatalogEntry("Book", "Paper", 3000, None, 60, 25, 15, "300 pages", ("paperback", "hardcover")),
+    ]),
+    ("VEHICLES", "liters", [
+        CatalogEntry("Car", "Transport", 400000, None, 5, 80, 15, "average", ("automobile",)),
+        CatalogEntry("Bicycle", "Transport", 5000, None, 20, 60, 20, "", ("bike",)),
+    ]),
+]
+
+CATALOG = [entry for _, _, entries in REFERENCE_SECTIONS for entry in entries]
+
+# Swaps only point at other reference entries, so every figure shown comes
+# from the reference data; products without one get no swap
+SWAPS = {
+    "Beef": "Chicken",
+    "Pork": "Chicken",
+    "Avocado": "Banana",
+    "Desktop Computer": "Laptop",
+    "Car": "Bicycle",
+}
+
+
+def render_reference_data():
+    lines = []
+    for heading, style, entries in REFERENCE_SECTIONS:
+        lines.append(f"### {heading}")
+        for e in entries:
+            mix = f"(Green: {e.green_pct:g}%, Blue: {e.blue_pct:g}%, Grey: {e.grey_pct:g}%)"
+            if style == "liters":
+                lines.append(f"- {e.label}: {e.liters:,.0f} liters {mix}")
+            else:
+                water = "L water" if style == "water" else "L"
+                lines.append(f"- {e.label}: {e.liters:,.0f}{water}, {e.carbon_kg:g}kg CO2 {mix}")
+        lines.append("")
+    return "\n".join(lines).rstrip("\n")
+
+
+def _normalize(text):
+    tokens = re.findall(r"[a-z0-9]+", text.lower())
+    # crude plural folding so "apples"/"apple" and "jeans"/"jean" agree
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+
+def _trigrams(tokens):
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _contains_in_order(tokens, query_tokens):
+    remaining = iter(tokens)
+    return all(token in remaining for token in query_tokens)
+
+
+class CatalogIndex:
+    def __init__(self, entries, min_score=0.46):
+        self.entries = list(entries)
+        self.min_score = min_score
+        self._exact = {}
+        self._names = []
+        self._by_token = defaultdict(set)
+        self._by_trigram = defaultdict(set)
+        self._sequences = []
+        self._memo = {}
+
+        for i, entry in enumerate(self.entries):
+            for name in (entry.name, entry.label) + entry.aliases:
+                tokens = _normalize(name)
+                key = " ".join(tokens)
+                self._exact.setdefault(key, i)
+                n = len(self._names)
+                self._names.append((i, set(tokens), _trigrams(tokens)))
+                # The label's serving size ("Wine (1 glass)") is exact-match
+                # only, so "wine glass" does not read as a glass of wine
+                self._sequences.append(tokens if name != entry.label or name == entry.name else ())
+                for token in tokens:
+                    self._by_token[token].add(n)
+                for gram in self._names[n][2]:
+                    self._by_trigram[gram].add(n)
+
+    def lookup(self, query):
+        # A confident match only: the exact name/alias, or a name/alias that
+        # contains every query token in order ("cotton shirt" -> Cotton
+        # T-shirt). A fuzzy hit on one shared word ("oat milk" -> Milk,
+        # "apple watch" -> Apple) is not an answer; search() still ranks
+        # those as suggestions.
+        tokens = _normalize(query)
+        if not tokens:
+            return None
+        key = " ".join(tokens)
+        if key in self._exact:
+            return self.entries[self._exact[key]]
+        token_set, grams = set(tokens), _trigrams(tokens)
+        best = None
+        for n in self._by_token.get(tokens[0], ()):
+            if _contains_in_order(self._sequences[n], tokens):
+                score = self._score(n, token_set, grams)
+                if best is None or score > best[0]:
+                    best = (score, self._names[n][0])
+        return self.entries[best[1]] if best else None
+
+    def search(self, query, limit=5):
+        memo_key = (query, limit)
+        if memo_key in self._memo:
+            return self._memo[memo_key]
+        matches = self._search(query, limit)
+        if len(self._memo) >= 4096:
+            self._memo.clear()
+        self._memo[memo_key] = matches
+        return matches
+
+    def _score(self, n, token_set, grams):
+        _, name_tokens, name_grams = self._names[n]
+        gram_score = len(grams & name_grams) / len(grams | name_grams)
+        token_score = len(token_set & name_tokens) / len(token_set | name_tokens)
+        return 0.6 * gram_score + 0.4 * token_score
+
+    def _search(self, query, limit):
+        tokens = _normalize(query)
+        if not tokens:
+            return []
+        key = " ".join(tokens)
+        if key in self._exact:
+            return [(self.entries[self._exact[key]], 1.0)]
+
+        token_set = set(tokens)
+        grams = _trigrams(tokens)
+        candidates = set()
+        for token in token_set:
+            candidates |= self._by_token.get(token, set())
+        for gram in grams:
+            candidates |= self._by_trigram.get(gram, set())
+
+        best = {}
+        for n in candidates:
+            i = self._names[n][0]
+            score = self._score(n, token_set, grams)
+            if score >= self.min_score and score > best.get(i, 0):
+                best[i] = score
+
+        ranked = sorted(best.items(), key=lambda x: x[1], reverse=True)[:limit]
+        return [(self.entries[i], score) for i, score in ranked]
+
+
+_index = None
+
+def get_catalog_index():
+    global _index
+    if _index is None:
+        _index = CatalogIndex(CATALOG)
+    return _index
+
+
+def get_entry(name):
+    for entry in CATALOG:
+        if entry.name == name:
+            return entry
+    return None
+
+
+def _resolve_swap(entry):
+    target = get_entry(SWAPS[entry.name]) if entry.name in SWAPS else None
+    if target is None:
+        return CatalogSwap(entry.name, entry.liters, entry.carbon_kg or 0, "No lower-footprint alternative in the reference data.")
+    reasoning = f"{target.name} needs {100 * (1 - target.liters / entry.liters):.0f}% less water than {entry.name.lower()}."
+    return CatalogSwap(target.name, target.liters, target.carbon_kg or 0, reasoning)
+
+
+def analysis_from_entry(entry, quantity=1.0):
+    swap = _resolve_swap(entry)
+    total = entry.liters * quantity
+    carbon = (entry.carbon_kg or 0) * quantity
+    swap_liters = swap.liters * quantity
+    swap_carbon = swap.carbon_kg * quantity
+    savings = max(total - swap_liters, 0)
+    savings_pct = 100 * savings / total if total else 0
+    carbon_savings = max(carbon - swap_carbon, 0)
+
+    name = entry.label if quantity == 1 else f"{quantity:g} × {entry.label}"
+    steps = [f"Choose {swap.name} instead of {entry.name.lower()} to save {savings:,.0f}L"] if savings else []
+
+    return WaterFootprintAnalysis(
+        product_name=name,
+        product_category=entry.category,
+        total_liters=total,
+        carbon_kg=carbon,
+        breakdown=WaterBreakdown(
+            green_water_pct=entry.green_pct,
+            blue_water_pct=entry.blue_pct,
+            grey_water_pct=entry.grey_pct
+        ),
+        sustainable_swap=SustainableSwap(
+            product_name=swap.name,
+            water_liters=swap_liters,
+            carbon_kg=swap_carbon,
+            savings_liters=savings,
+            savings_percentage=savings_pct,
+            reasoning=swap.reasoning
+        ),
+        actionable_steps=steps,
+        collective_impact=f"If 1000 people switched, save {savings * 1000:,.0f} liters + {carbon_savings * 1000:,.0f} kg CO2",
+        confidence_score=CATALOG_CONFIDENCE,
+        data_source=f"BluePrint catalog {CATALOG_VERSION} ({CATALOG_SOURCE})",
+    )
+
+
+def analyze_text(name, quantity=1.0):
+    entry = get_catalog_index().lookup(name)
+    if entry is None:
+        return None
+    return analysis_from_entry(entry, quantity)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+from google import genai
+from google.genai import types
+
+from .config import config
+from .metrics import get_metrics
+
+
+def create_client(api_key, base_url=None, verify=True):
+    # httpx closes idle connections after 5s by default, so a user clicking
+    # every half minute would pay a fresh TLS handshake each time. Analyses
+    # set their own per-request timeout; the client default bounds the rest.
+    limits = httpx.Limits(
+        max_connections=config.CLIENT_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=config.CLIENT_POOL_MAX_CONNECTIONS,
+        keepalive_expiry=config.CLIENT_KEEPALIVE_SECONDS
+    )
+    client_args = {'limits': limits}
+    if verify is not True:
+        client_args['verify'] = verify
+    client = genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            base_url=base_url, timeout=int(config.API_TIMEOUT_SECONDS * 1000) or None,
+            client_args=client_args, async_client_args=client_args
+        )
+    )
+    _client_args[client] = (api_key, base_url, verify)
+    return client
+
+
+_client_args = weakref.WeakKeyDictionary()
+_loop_clients = {}
+_loop_clients_lock = threading.Lock()
+
+def aio_client(client):
+    # client.aio keeps one httpx.AsyncClient whose pooled connections belong
+    # to the event loop that opened them; reused from another loop (e.g. a
+    # second asyncio.run) they fail with "Event loop is closed". Each running
+    # loop therefore gets its own copy of a create_client() client, released
+    # once that loop is closed. Other clients (test doubles) are used as is.
+    args = _client_args.get(client) if isinstance(client, genai.Client) else None
+    if args is None:
+        return client.aio
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        stale = [_loop_clients.pop(l) for l in list(_loop_clients) if l.is_closed()]
+        if stale:
+            # genai closes a collected aio client on whatever loop is running,
+            # which fails for connections of a closed loop; released on a
+            # plain thread, there is no running loop and they are just dropped
+            threading.Thread(target=stale.clear, name="genai-release", daemon=True).start()
+        clients = _loop_clients.setdefault(loop, weakref.WeakKeyDictionary())
+        copy = clients.get(client)
+        if copy is None:
+            copy = clients[client] = create_client(*args)
+    return copy.aio
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key):
+    # One genai.Client (and connection pool) per API key for the whole process;
+    # httpx clients are safe to share across threads.
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = create_client(api_key)
+        return client
+
+
+def warm_up(client, model_name):
+    # A model metadata GET opens the TLS connection and checks the key
+    # without spending tokens; the connection then stays in the pool.
+    started = time.perf_counter()
+    try:
+        client.models.get(model=model_name)
+        outcome = 'ok'
+    except Exception:
+        outcome = 'error'
+    get_metrics().observe('warmup_seconds', time.perf_counter() - started, model=model_name, outcome=outcome)
+    return outcome == 'ok'
+
+
+def prewarm(api_key, model_name, background=True):
+    client = get_client(api_key)
+    if background:
+        threading.Thread(target=warm_up, args=(client, model_name), name="genai-prewarm", daemon=True).start()
+    else:
+        warm_up(client, model_name)
+    return client
@@ -1,14 +1,13 @@
 import os
+import sys
 from dataclasses import dataclass, field
 
-try:
-    import streamlit as st
-    USE_SECRETS = True
-except ImportError:
-    USE_SECRETS = False
 
 def get_secret(key, default=""):
-    if USE_SECRETS and hasattr(st, 'secrets'):
+    # Only consult st.secrets when running under Streamlit, so headless entry
+    # points (e.g. `python -m src.batch`) never pay for importing it.
+    st = sys.modules.get('streamlit')
+    if st is not None and hasattr(st, 'secrets'):
         try:
             return st.secrets.get(key, default)
         except (FileNotFoundError, KeyError):
@@ -27,6 +26,21 @@ class AppConfig:
     GEMINI_MODEL: str = field(
         default_factory=lambda: get_secret("GEMINI_MODEL", "gemini-2.5-flash")
     )
+    GEMINI_API_KEYS: str = field(default_factory=lambda: get_secret("GEMINI_API_KEYS", ""))
+    GEMINI_MODELS: str = field(default_factory=lambda: get_secret("GEMINI_MODELS", ""))
+    ROUTING_STRATEGY: str = field(
+        default_factory=lambda: get_secret("ROUTING_STRATEGY", "least_loaded")
+    )
+    ENDPOINT_EJECT_SECONDS: float = field(
+        default_factory=lambda: float(get_secret("ENDPOINT_EJECT_SECONDS", "60"))
+    )
+    
+    GEMINI_INPUT_USD_PER_MTOK: float = field(
+        default_factory=lambda: float(get_secret("GEMINI_INPUT_USD_PER_MTOK", "0.30"))
+    )
+    GEMINI_OUTPUT_USD_PER_MTOK: float = field(
+        default_factory=lambda: float(get_secret("GEMINI_OUTPUT_USD_PER_MTOK", "2.50"))
+    )
     
     API_TIMEOUT_SECONDS: int = field(
         default_factory=lambda: int(get_secret("API_TIMEOUT_SECONDS", "30"))
@@ -34,6 +48,92 @@ class AppConfig:
     MAX_IMAGE_SIZE_MB: int = field(
         default_factory=lambda: int(get_secret("MAX_IMAGE_SIZE_MB", "10"))
     )
+    MODEL_IMAGE_MAX_DIM: int = field(
+        default_factory=lambda: int(get_secret("MODEL_IMAGE_MAX_DIM", "768"))
+    )
+    MODEL_IMAGE_QUALITY: int = field(
+        default_factory=lambda: int(get_secret("MODEL_IMAGE_QUALITY", "85"))
+    )
+    STREAM_RESPONSES: bool = field(
+        default_factory=lambda: str(get_secret("STREAM_RESPONSES", "true")).lower() in ("1", "true", "yes")
+    )
+    ASYNC_MAX_CONCURRENCY: int = field(
+        default_factory=lambda: int(get_secret("ASYNC_MAX_CONCURRENCY", "64"))
+    )
+    
+    RESULT_CACHE_SIZE: int = field(
+        default_factory=lambda: int(get_secret("RESULT_CACHE_SIZE", "256"))
+    )
+    RESULT_CACHE_TTL_SECONDS: int = field(
+        default_factory=lambda: int(get_secret("RESULT_CACHE_TTL_SECONDS", "604800"))
+    )
+    RESULT_CACHE_PATH: str = field(
+        default_factory=lambda: get_secret("RESULT_CACHE_PATH", ".cache/results.sqlite3")
+    )
+    RESULT_CACHE_DISK_ROWS: int = field(
+        default_factory=lambda: int(get_secret("RESULT_CACHE_DISK_ROWS", "10000"))
+    )
+    FIGURE_CACHE_SIZE: int = field(
+        default_factory=lambda: int(get_secret("FIGURE_CACHE_SIZE", "128"))
+    )
+    CHART_POINT_BUDGET: int = field(
+        default_factory=lambda: int(get_secret("CHART_POINT_BUDGET", "1000"))
+    )
+    CHART_WEBGL_THRESHOLD: int = field(
+        default_factory=lambda: int(get_secret("CHART_WEBGL_THRESHOLD", "500"))
+    )
+    HISTORY_PATH: str = field(
+        default_factory=lambda: get_secret("HISTORY_PATH", ".cache/history.sqlite3")
+    )
+    NEAR_DUPLICATE_MAX_DISTANCE: int = field(
+        default_factory=lambda: int(get_secret("NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+    )
+    CONTEXT_CACHE_ENABLED: bool = field(
+        default_factory=lambda: str(get_secret("CONTEXT_CACHE_ENABLED", "false")).lower() in ("1", "true", "yes")
+    )
+    CONTEXT_CACHE_TTL_SECONDS: int = field(
+        default_factory=lambda: int(get_secret("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    )
+    RATE_LIMIT_RPM: int = field(
+        default_factory=lambda: int(get_secret("RATE_LIMIT_RPM", "60"))
+    )
+    RATE_LIMIT_BURST: int = field(
+        default_factory=lambda: int(get_secret("RATE_LIMIT_BURST", "10"))
+    )
+    RETRY_MAX_ATTEMPTS: int = field(
+        default_factory=lambda: int(get_secret("RETRY_MAX_ATTEMPTS", "3"))
+    )
+    RETRY_BASE_DELAY_SECONDS: float = field(
+        default_factory=lambda: float(get_secret("RETRY_BASE_DELAY_SECONDS", "1.0"))
+    )
+    RETRY_MAX_DELAY_SECONDS: float = field(
+        default_factory=lambda: float(get_secret("RETRY_MAX_DELAY_SECONDS", "30"))
+    )
+    CIRCUIT_FAILURE_RATE: float = field(
+        default_factory=lambda: float(get_secret("CIRCUIT_FAILURE_RATE", "0.5"))
+    )
+    CIRCUIT_COOLDOWN_SECONDS: float = field(
+        default_factory=lambda: float(get_secret("CIRCUIT_COOLDOWN_SECONDS", "30"))
+    )
+    SINGLE_FLIGHT_LOCK_DIR: str = field(
+        default_factory=lambda: get_secret("SINGLE_FLIGHT_LOCK_DIR", "")
+    )
+    CLIENT_POOL_MAX_CONNECTIONS: int = field(
+        default_factory=lambda: int(get_secret("CLIENT_POOL_MAX_CONNECTIONS", "32"))
+    )
+    CLIENT_KEEPALIVE_SECONDS: float = field(
+        default_factory=lambda: float(get_secret("CLIENT_KEEPALIVE_SECONDS", "120"))
+    )
+    HEDGE_ENABLED: bool = field(
+        default_factory=lambda: str(get_secret("HEDGE_ENABLED", "false")).lower() in ("1", "true", "yes")
+    )
+    HEDGE_PERCENTILE: float = field(
+        default_factory=lambda: float(get_secret("HEDGE_PERCENTILE", "0.95"))
+    )
+    HEDGE_MAX_RATE: float = field(
+        default_factory=lambda: float(get_secret("HEDGE_MAX_RATE", "0.05"))
+    )
+    
     DAILY_DRINKING_WATER_LITERS: float = 3.0
     SHOWER_LITERS_PER_MINUTE: float = 9.5
     TOILET_FLUSH_LITERS: float = 6.0
@@ -61,6 +161,11 @@ water_colors = WaterCategoryColors()
 
 
 def validate_config():
+    if config.GEMINI_API_KEYS:
+        keys = [k.split(':')[0].strip() for k in config.GEMINI_API_KEYS.split(',') if k.strip()]
+        if any(len(k) < 10 for k in keys):
+            return False, "GEMINI_API_KEYS contains an invalid (too short) key."
+        return True, None
     if not config.GEMINI_API_KEY:
         return False, "GEMINI_API_KEY environment variable is not set."
     if len(config.GEMINI_API_KEY) < 10:
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from google.genai import types
+
+from .metrics import get_metrics
+
+
+class ContextCache:
+    # Keeps one server-side cached-content handle for a static system
+    # instruction, refreshing its TTL before expiry. Any failure disables it for
+    # `retry_after` seconds and name() returns None so callers fall back to
+    # sending the instruction inline.
+    def __init__(self, client, model_name, system_instruction, ttl_seconds=3600, retry_after=600):
+        self.client = client
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        self.retry_after = retry_after
+        self._name = None
+        self._expires_at = 0.0
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+
+    def name(self):
+        now = time.time()
+        if self._name and now < self._expires_at - self._refresh_margin():
+            return self._name
+        if now < self._disabled_until:
+            return None
+
+        with self._lock:
+            now = time.time()
+            if self._name and now < self._expires_at - self._refresh_margin():
+                return self._name
+            try:
+                if self._name and now < self._expires_at:
+                    self.client.caches.update(
+                        name=self._name,
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+                    )
+                    get_metrics().inc('context_cache_events_total', event='refreshed', model=self.model_name)
+                else:
+                    cached = self.client.caches.create(
+                        model=self.model_name,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=self.system_instruction,
+                            display_name="blueprint-system-prompt",
+                            ttl=f"{self.ttl_seconds}s"
+                        )
+                    )
+                    self._name = cached.name
+                    get_metrics().inc('context_cache_events_total', event='created', model=self.model_name)
+                self._expires_at = now + self.ttl_seconds
+                return self._name
+            except Exception:
+                self._disable(now)
+                return None
+
+    def invalidate(self):
+        with self._lock:
+            self._disable(time.time())
+
+    def _disable(self, now):
+        self._name = None
+        self._expires_at = 0.0
+        self._disabled_until = now + self.retry_after
+        get_metrics().inc('context_cache_events_total', event='unavailable', model=self.model_name)
+
+    def _refresh_margin(self):
+        return min(60, self.ttl_seconds / 10)
+
+
+_context_caches = {}
+_context_caches_lock = threading.Lock()
+
+def get_context_cache(client, api_key, model_name, system_instruction, ttl_seconds):
+    key = (api_key, model_name, hash(system_instruction))
+    with _context_caches_lock:
+        if key not in _context_caches:
+            _context_caches[key] = ContextCache(client, model_name, system_instruction, ttl_seconds)
+        return _context_caches[key]
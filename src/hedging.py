@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from .config import config
+from .metrics import get_metrics
+
+
+class Hedger:
+    # Tail-latency hedging: when a call has not returned after the
+    # `percentile` of recent call latencies, a duplicate is started and the
+    # first success wins. Each request earns `max_rate` hedge tokens (up to a
+    # small burst) and each hedge spends one, so at most ~max_rate of requests
+    # are duplicated even when upstream is uniformly slow.
+    #
+    # hedge_latency_seconds{path="primary"} is what callers would have waited
+    # without hedging, {path="effective"} what they did wait. A primary
+    # cancelled by a winning hedge never finishes, so its latency is unknown:
+    # it goes to {path="primary_cancelled"} as a censored sample (the time at
+    # cancellation, a lower bound) and is left out of "primary".
+    def __init__(self, name="analysis", percentile=0.95, max_rate=0.05, min_samples=20, window=512):
+        self.name = name
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.burst = max(1.0, max_rate * 100)
+        self._latencies = deque(maxlen=window)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def delay(self):
+        # Seconds to wait before hedging, or None until enough calls are seen
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _admit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+        return self.delay()
+
+    def _spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _record(self, started, primary_done, primary_path='primary'):
+        # Caller-visible latency vs. the primary's own (the no-hedging latency)
+        metrics = get_metrics()
+        metrics.observe('hedge_latency_seconds', time.perf_counter() - started, flight=self.name, path='effective')
+        metrics.observe('hedge_latency_seconds', primary_done - started, flight=self.name, path=primary_path)
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="hedge", daemon=True).start()
+            return self._loop
+
+    def call(self, fn):
+        # Blocking callers are hedged too, but `fn` must return a coroutine
+        # (a call on the async client): a blocking request cannot be
+        # interrupted, so both copies run as tasks on the hedger's own event
+        # loop, where the loser is cancelled exactly as in call_async.
+        return asyncio.run_coroutine_threadsafe(self.call_async(fn), self._event_loop()).result()
+
+    async def call_async(self, fn):
+        # The losing copy is cancelled, which aborts its upstream request
+        started = time.perf_counter()
+        delay = self._admit()
+        finished = {}
+
+        async def timed(role):
+            began = time.perf_counter()
+            try:
+                result = await fn()
+            finally:
+                finished[role] = time.perf_counter()
+            self.observe(finished[role] - began)
+            return result
+
+        if delay is None:
+            result = await timed('primary')
+            self._record(started, finished['primary'])
+            return result
+
+        metrics = get_metrics()
+        primary = asyncio.ensure_future(timed('primary'))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done and not self._spend():
+                metrics.inc('hedges_total', flight=self.name, outcome='budget_exhausted')
+                done, _ = await asyncio.wait({primary})
+            if done:
+                result = primary.result()
+                self._record(started, finished['primary'])
+                return result
+
+            hedge = asyncio.ensure_future(timed('hedge'))
+            tasks.add(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        metrics.inc('hedges_total', flight=self.name, outcome='won' if task is hedge else 'lost')
+                        if 'primary' in finished:
+                            self._record(started, finished['primary'])
+                        else:
+                            self._record(started, time.perf_counter(), 'primary_cancelled')
+                        return task.result()
+                    if task is primary or error is None:
+                        error = task.exception()
+            metrics.inc('hedges_total', flight=self.name, outcome='failed')
+            self._record(started, finished['primary'])
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def get_hedger():
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(percentile=config.HEDGE_PERCENTILE, max_rate=config.HEDGE_MAX_RATE)
+        return _hedger
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .config import config
+from .models import WaterFootprintAnalysis
+
+
+class ColumnarHistory:
+    # Struct-of-arrays scan history for analytics and charts: one growable
+    # NumPy column per numeric field (capacity doubles, so appends are
+    # amortized O(1)) and categories dictionary-encoded as uint16 codes into
+    # `categories`, in order of first appearance. Values stay float64: sums
+    # over millions of scans must stay exact to the liter, and a float32
+    # confidence shifts means across the 0.6 tip threshold.
+    COLUMNS = {
+        'created': np.float64,
+        'total_liters': np.float64,
+        'carbon_kg': np.float64,
+        'swap_savings_liters': np.float64,
+        'swap_carbon_kg': np.float64,
+        'confidence': np.float64,
+        'category': np.uint16,
+    }
+
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._data = {name: np.empty(capacity, dtype) for name, dtype in self.COLUMNS.items()}
+        self.categories = []
+        self._codes = {}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        # A column as a view over the filled prefix, e.g. history['total_liters']
+        return self._data[name][:self._size]
+
+    @property
+    def nbytes(self):
+        return sum(column[:self._size].nbytes for column in self._data.values())
+
+    def category_code(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._data['created'])
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        for name, column in self._data.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._data[name] = grown
+
+    def append(self, analysis, created=None):
+        self.append_row(
+            created if created is not None else time.time(),
+            analysis.total_liters,
+            getattr(analysis, 'carbon_kg', 0) or 0,
+            analysis.sustainable_swap.savings_liters,
+            getattr(analysis.sustainable_swap, 'carbon_kg', 0) or 0,
+            analysis.confidence_score,
+            analysis.product_category
+        )
+
+    def append_row(self, created, total_liters, carbon_kg, swap_savings_liters, swap_carbon_kg, confidence, category):
+        self._reserve(1)
+        i = self._size
+        data = self._data
+        data['created'][i] = created
+        data['total_liters'][i] = total_liters
+        data['carbon_kg'][i] = carbon_kg
+        data['swap_savings_liters'][i] = swap_savings_liters
+        data['swap_carbon_kg'][i] = swap_carbon_kg
+        data['confidence'][i] = confidence
+        data['category'][i] = self.category_code(category)
+        self._size += 1
+
+    def extend_rows(self, rows):
+        # Bulk load of (created, total_liters, carbon_kg, swap_savings_liters,
+        # swap_carbon_kg, confidence, category) tuples
+        rows = list(rows)
+        if not rows:
+            return
+        self._reserve(len(rows))
+        start, end = self._size, self._size + len(rows)
+        columns = list(zip(*rows))
+        for name, values in zip(list(self.COLUMNS)[:-1], columns[:-1]):
+            self._data[name][start:end] = values
+        self._data['category'][start:end] = [self.category_code(c) for c in columns[-1]]
+        self._size = end
+
+    @classmethod
+    def from_analyses(cls, analyses, created=None):
+        history = cls(max(len(analyses), 1))
+        for i, analysis in enumerate(analyses):
+            history.append(analysis, created[i] if created is not None else 0.0)
+        return history
+
+    def category_counts(self):
+        # {category: count} in order of first appearance
+        counts = np.bincount(self['category'], minlength=len(self.categories))
+        return {self.categories[code]: int(count) for code, count in enumerate(counts) if count}
+
+
+class HistoryStore:
+    # Scan history per user in SQLite. Each scan carries an idempotency key
+    # (unique per user), so recording the same scan twice is a no-op; the
+    # `totals` row is updated in the same transaction as the insert, so the
+    # sidebar reads its sums in O(1) instead of re-adding every scan.
+    def __init__(self, path):
+        self.path = str(path)
+        self._memory = self.path == ':memory:'
+        if self._memory:
+            # A named shared-cache database is visible to every thread's
+            # connection and lives while any connection stays open
+            self.path = f"file:history-{id(self)}?mode=memory&cache=shared"
+        else:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._keepalive = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            "id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, session_id TEXT, "
+            "idempotency_key TEXT NOT NULL, created REAL NOT NULL, "
+            "product_name TEXT NOT NULL, category TEXT NOT NULL, "
+            "total_liters REAL NOT NULL, carbon_kg REAL NOT NULL, analysis TEXT NOT NULL, "
+            "UNIQUE (user_id, idempotency_key));"
+            "CREATE INDEX IF NOT EXISTS idx_scans_user_created ON scans(user_id, created);"
+            "CREATE INDEX IF NOT EXISTS idx_scans_user_category ON scans(user_id, category, created);"
+            "CREATE TABLE IF NOT EXISTS totals ("
+            "user_id TEXT PRIMARY KEY, items INTEGER NOT NULL, "
+            "total_liters REAL NOT NULL, carbon_kg REAL NOT NULL);"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, uri=self._memory)
+            if not self._memory:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, user_id, analysis, idempotency_key, session_id=None, created=None):
+        # Returns True if the scan was recorded, False if the key was seen before
+        carbon = getattr(analysis, 'carbon_kg', 0) or 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO scans (user_id, session_id, idempotency_key, created, product_name, "
+                "category, total_liters, carbon_kg, analysis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, session_id, idempotency_key, created or time.time(), analysis.product_name,
+                 analysis.product_category, analysis.total_liters, carbon, analysis.model_dump_json())
+            )
+            inserted = cursor.rowcount > 0
+            if inserted:
+                conn.execute(
+                    "INSERT INTO totals (user_id, items, total_liters, carbon_kg) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET items = items + 1, "
+                    "total_liters = total_liters + excluded.total_liters, carbon_kg = carbon_kg + excluded.carbon_kg",
+                    (user_id, analysis.total_liters, carbon)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted
+
+    def totals(self, user_id):
+        row = self._conn().execute(
+            "SELECT items, total_liters, carbon_kg FROM totals WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        items, total_liters, carbon_kg = row or (0, 0.0, 0.0)
+        return {'items': items, 'total_liters': total_liters, 'carbon_kg': carbon_kg}
+
+    def analyses(self, user_id, since=None, category=None, limit=None):
+        # Oldest first; `limit` keeps the most recent scans
+        clauses, params = ["user_id = ?"], [user_id]
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        query = f"SELECT analysis FROM scans WHERE {' AND '.join(clauses)} ORDER BY created DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._conn().execute(query, params).fetchall()
+        return [WaterFootprintAnalysis.model_validate_json(row[0]) for row in reversed(rows)]
+
+    def columns(self, user_id):
+        # Loads straight into a ColumnarHistory; swap and confidence fields
+        # are pulled out of the stored JSON by SQLite without building models
+        history = ColumnarHistory()
+        history.extend_rows(self._conn().execute(
+            "SELECT created, total_liters, carbon_kg, "
+            "COALESCE(json_extract(analysis, '$.sustainable_swap.savings_liters'), 0), "
+            "COALESCE(json_extract(analysis, '$.sustainable_swap.carbon_kg'), 0), "
+            "json_extract(analysis, '$.confidence_score'), category "
+            "FROM scans WHERE user_id = ? ORDER BY created, id",
+            (user_id,)
+        ))
+        return history
+
+    def scan_measures(self, batch_size=10000):
+        # (total_liters, carbon_kg) arrays over every user's scans, in batches
+        cursor = self._conn().execute("SELECT total_liters, carbon_kg FROM scans")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            values = np.array(rows, dtype=np.float64)
+            yield values[:, 0], values[:, 1]
+
+    def user_category_totals(self):
+        # (user_id, category, items, total_liters) rows, grouped by user
+        return self._conn().execute(
+            "SELECT user_id, category, COUNT(*), SUM(total_liters) FROM scans "
+            "GROUP BY user_id, category ORDER BY user_id"
+        )
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+def get_history_store():
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            path = os.path.expanduser(config.HISTORY_PATH) if config.HISTORY_PATH else ':memory:'
+            try:
+                _history_store = HistoryStore(path)
+            except (sqlite3.Error, OSError):
+                _history_store = HistoryStore(':memory:')
+        return _history_store
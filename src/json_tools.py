@@ -0,0 +1,242 @@
+import json
+import re
+from bisect import bisect_left, bisect_right
+
+
+class IncrementalJSONParser:
+    # Emits top-level fields of a streamed JSON object as soon as each value is
+    # complete. Text before the first "{" (e.g. a ```json fence) is ignored.
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._expect = 'key'
+
+    def feed(self, chunk):
+        self.text += chunk
+        new_fields = {}
+        text = self.text
+        i = self._pos
+        n = len(text)
+
+        while i < n and not self.done:
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._expect == 'key':
+                            self._key = json.loads(text[self._key_start:i + 1])
+                            self._expect = 'colon'
+                        elif self._expect == 'value':
+                            self._emit(new_fields, self._value_start, i + 1)
+                i += 1
+                continue
+
+            if self._depth == 0:
+                if c == '{':
+                    self._depth = 1
+                    self._expect = 'key'
+                i += 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._expect == 'key':
+                        self._key_start = i
+                    elif self._expect == 'value_start':
+                        self._value_start = i
+                        self._expect = 'value'
+            elif c in '{[':
+                if self._depth == 1 and self._expect == 'value_start':
+                    self._value_start = i
+                    self._expect = 'value'
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._expect == 'value':
+                    self._emit(new_fields, self._value_start, i + 1)
+                elif self._depth == 0:
+                    if self._expect in ('value', 'scalar'):
+                        self._emit(new_fields, self._value_start, i)
+                    self.done = True
+            elif self._depth == 1:
+                if c == ':' and self._expect == 'colon':
+                    self._expect = 'value_start'
+                elif c == ',':
+                    if self._expect == 'scalar':
+                        self._emit(new_fields, self._value_start, i)
+                    self._expect = 'key'
+                elif self._expect == 'value_start' and not c.isspace():
+                    self._value_start = i
+                    self._expect = 'scalar'
+            i += 1
+
+        self._pos = i
+        return new_fields
+
+    def _emit(self, new_fields, start, end):
+        try:
+            value = json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            value = None
+        else:
+            self.fields[self._key] = value
+            new_fields[self._key] = value
+        self._expect = 'after_value'
+        self._key = None
+
+
+_OBJECT_START = re.compile(r'\{\s*["}]')
+_STRUCTURE = re.compile(r'[{}\[\]",]')
+_STRING_END = re.compile(r'["\\]')
+_CLOSERS = {'{': '}', '[': ']'}
+_decoder = json.JSONDecoder()
+
+
+def extract_json_object(text):
+    # Returns the first top-level JSON object in `text` that parses, skipping
+    # fences and prose around it. Well-formed objects are decoded in place;
+    # anything else goes through _scan_object, which visits each character once
+    # and skips a candidate that fails to parse as a whole, so the total work
+    # stays linear in len(text). A truncated candidate that cannot be repaired
+    # does not end the search: the objects nested in it are tried next.
+    pos = 0
+    while True:
+        match = _OBJECT_START.search(text, pos)
+        if match is None:
+            raise json.JSONDecodeError("No JSON object found", text, pos)
+        start = match.start()
+        try:
+            result, _ = _decoder.raw_decode(text, start)
+            return result
+        except (json.JSONDecodeError, RecursionError):
+            pass
+        result, pos = _scan_object(text, start)
+        if result is not None:
+            return result
+
+
+def _scan_object(text, start):
+    # Finds where the object at `start` ends, dropping trailing commas. An
+    # object cut off at the end of the text is closed after its last complete
+    # element. Returns (object or None, position to resume the search from).
+    stack = [('{', start)]
+    drop = []                   # trailing commas to remove, in text order
+    comma = None                # last comma at the current nesting level
+    safe = (start + 1, 1)       # (cut, depth) just after the last complete element
+    closes = {}                 # nested object start -> its end
+    end = None
+    i = start + 1
+    while end is None:
+        match = _STRUCTURE.search(text, i)
+        if match is None:
+            break
+        i = match.start()
+        c = text[i]
+        if c == '"':
+            m = _STRING_END.search(text, i + 1)
+            while m is not None and text[m.start()] == '\\':
+                m = _STRING_END.search(text, m.start() + 2)
+            if m is None:
+                break
+            i = m.end()
+            continue
+        if c == ',':
+            comma = i
+            safe = (i, len(stack))
+        elif c in '{[':
+            stack.append((c, i))
+            comma = None
+            safe = (i + 1, len(stack))
+        elif _CLOSERS[stack[-1][0]] != c:
+            return None, i + 1  # stray bracket: not JSON
+        else:
+            if comma is not None and not text[comma + 1:i].strip():
+                drop.append(comma)
+            comma = None
+            opener, at = stack.pop()
+            if stack:
+                safe = (i + 1, len(stack))
+                if opener == '{':
+                    closes[at] = i + 1
+            else:
+                end = i + 1
+        i += 1
+
+    if end is not None:
+        candidate = _without(text, start, end, drop)
+    else:
+        cut, depth = safe
+        candidate = _without(text, start, cut, [d for d in drop if d < cut])
+        candidate += ''.join(_CLOSERS[b] for b, _ in reversed(stack[:depth]))
+
+    try:
+        return json.loads(candidate), end
+    except (json.JSONDecodeError, RecursionError):
+        if end is not None:
+            return None, end
+    result = _nested_candidate(text, start, candidate, drop, closes, stack[1:safe[1]])
+    if result is None:
+        raise json.JSONDecodeError("Truncated JSON object could not be repaired", text, start)
+    return result, len(text)
+
+
+def _nested_candidate(text, start, repaired, drop, closes, open_objects):
+    # A truncated object that cannot be repaired runs to the end of the text,
+    # so the search continues with the objects nested in it, first in text
+    # order. One that closed is parsed from its own span, and its insides are
+    # skipped if that fails, so those spans are parsed at most once. The ones
+    # still open at the end are nested in each other and decoded from the
+    # repaired text, where their closers are already in place; if one parses,
+    # so does every object inside it, so the first that parses is found by
+    # bisection in O(log n) decodes.
+    opened = [at for b, at in open_objects if b == '{' and _OBJECT_START.match(text, at)]
+    lo, hi = 0, len(opened)
+    found = None                # (start, object) of the outermost that parses
+    while lo < hi:
+        mid = (lo + hi) // 2
+        at = opened[mid]
+        try:
+            found = (at, _decoder.raw_decode(repaired, at - start - bisect_left(drop, at))[0])
+            hi = mid
+        except (json.JSONDecodeError, RecursionError):
+            lo = mid + 1
+
+    skip = start
+    for at in sorted(closes):
+        if found is not None and at > found[0]:
+            break
+        if at < skip or not _OBJECT_START.match(text, at):
+            continue
+        close = closes[at]
+        try:
+            return json.loads(_without(text, at, close, drop[bisect_right(drop, at):bisect_left(drop, close)]))
+        except (json.JSONDecodeError, RecursionError):
+            skip = close
+    return None if found is None else found[1]
+
+
+def _without(text, start, end, positions):
+    if not positions:
+        return text[start:end]
+    parts = []
+    prev = start
+    for p in positions:
+        parts.append(text[prev:p])
+        prev = p + 1
+    parts.append(text[prev:end])
+    return ''.join(parts)
@@ -0,0 +1,181 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return sorted_values[lo]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Summary:
+    # Exact count/sum plus percentiles over a sliding window of recent samples
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        data = {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else 0.0}
+        for q in QUANTILES:
+            data[f'p{int(q * 100)}'] = _percentile(ordered, q)
+        return data
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="blueprint", window=2048):
+        self.prefix = prefix
+        self.window = window
+        self.started = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _name(self, name):
+        return f"{self.prefix}_{name}" if self.prefix else name
+
+    def describe(self, name, help_text):
+        self._help[self._name(name)] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary(self.window)
+            summary.observe(value)
+
+    def counter_value(self, name, **labels):
+        return self._counters.get((self._name(name), _label_key(labels)), 0)
+
+    def summary(self, name, **labels):
+        with self._lock:
+            summary = self._summaries.get((self._name(name), _label_key(labels)))
+            return summary.snapshot() if summary else None
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            def group(items, render):
+                out = {}
+                for (name, key), value in items:
+                    out.setdefault(name, []).append({'labels': dict(key), **render(value)})
+                return out
+
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'counters': group(self._counters.items(), lambda v: {'value': v}),
+                'gauges': group(self._gauges.items(), lambda v: {'value': v}),
+                'summaries': group(self._summaries.items(), lambda s: s.snapshot()),
+            }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for kind, items in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted({n for n, _ in items}):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, key), value in sorted(items.items()):
+                        if n == name:
+                            lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name in sorted({n for n, _ in self._summaries}):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} summary")
+                for (n, key), summary in sorted(self._summaries.items()):
+                    if n != name:
+                        continue
+                    snap = summary.snapshot()
+                    for q in QUANTILES:
+                        lines.append(f"{name}{_format_labels(key, [('quantile', q)])} {snap[f'p{int(q * 100)}']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {snap['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {snap['count']}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = MetricsRegistry()
+
+_metrics.describe("requests_total", "Gemini calls by kind and outcome")
+_metrics.describe("latency_seconds", "Wall time per Gemini call")
+_metrics.describe("prompt_tokens", "Input tokens reported by usage_metadata")
+_metrics.describe("cached_tokens", "Prompt tokens served from a context cache")
+_metrics.describe("image_tokens", "Image input tokens reported by usage_metadata")
+_metrics.describe("output_tokens", "Output tokens reported by usage_metadata")
+_metrics.describe("parse_seconds", "Response parse time by path (schema or fallback extractor)")
+_metrics.describe("request_bytes", "Approximate request payload size")
+_metrics.describe("cost_usd", "Estimated cost per call from token counts")
+_metrics.describe("cache_results_total", "Analyses served from cache by tier")
+_metrics.describe("retries_total", "Gemini call retries by reason")
+_metrics.describe("rate_limit_wait_seconds", "Time spent waiting on the client-side token bucket")
+_metrics.describe("circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)")
+_metrics.describe("circuit_transitions_total", "Circuit breaker state changes")
+_metrics.describe("circuit_rejections_total", "Calls failed fast by an open circuit")
+_metrics.describe("single_flight_total", "Analyses that led or joined an identical in-flight call")
+_metrics.describe("warmup_seconds", "Connection pre-warm handshake time")
+_metrics.describe("context_cache_events_total", "System prompt context cache lifecycle events")
+_metrics.describe("endpoint_in_flight", "Requests in flight per API key and model")
+_metrics.describe("endpoint_headroom", "Fraction of the rate-limit burst available per API key and model")
+_metrics.describe("endpoint_latency_seconds", "Successful call latency per API key and model")
+_metrics.describe("endpoint_ejections_total", "Times an API key and model was taken out of rotation")
+_metrics.describe("deadline_exceeded_total", "Analyses that ran out of time, by stage")
+_metrics.describe("hedges_total", "Requests that reached the hedge delay, by outcome")
+_metrics.describe("hedge_latency_seconds", "Caller latency with hedging (effective) vs. the primary call alone (primary; primary_cancelled is censored at cancellation)")
+_metrics.describe("figure_cache_total", "Chart builds served from the figure cache, by chart")
+
+
+def get_metrics():
+    return _metrics
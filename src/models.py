@@ -1,6 +1,6 @@
 from dataclasses import dataclass
-from typing import Optional, List
-from pydantic import BaseModel, Field
+from typing import Optional, List, Union
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class WaterBreakdown(BaseModel):
@@ -12,7 +12,7 @@ class WaterBreakdown(BaseModel):
 class RegionalImpact(BaseModel):
     high_stress_regions: List[str] = Field(default_factory=list)
     scarcity_multiplier: float = Field(ge=1.0, le=5.0, default=1.0)
-    context: str = ""
+    context: str = Field(default="", description="How this affects water-scarce areas")
 
 
 class SustainableSwap(BaseModel):
@@ -21,22 +21,24 @@ class SustainableSwap(BaseModel):
     carbon_kg: float = Field(ge=0, default=0)
     savings_liters: float = Field(ge=0)
     savings_percentage: float = Field(ge=0, le=100)
-    reasoning: str
+    reasoning: str = Field(description="Why this is better")
 
 
 class WaterFootprintAnalysis(BaseModel):
     product_name: str
-    product_category: str
+    product_category: str = Field(description="Textiles/Food/Electronics/Agriculture/Paper/Transport/Other")
     total_liters: float = Field(ge=0)
     carbon_kg: float = Field(ge=0, default=0)
     breakdown: WaterBreakdown
     sustainable_swap: SustainableSwap
     regional_impact: Optional[RegionalImpact] = None
     actionable_steps: List[str] = Field(default_factory=list)
-    collective_impact: Optional[str] = None
+    collective_impact: Optional[str] = Field(
+        default=None, description="If 1000 people switched, save X liters + Y kg CO2/year"
+    )
     confidence_score: float = Field(ge=0, le=1)
     data_source: str = "WFN 2024 + IPCC"
-    fun_fact: Optional[str] = None
+    fun_fact: Optional[str] = Field(default=None, description="Compelling environmental fact")
     
     @property
     def green_water_liters(self):
@@ -93,3 +95,17 @@ class AnalysisError(BaseModel):
     message: str
     user_friendly_message: str
     retry_suggested: bool = True
+
+
+class ModelRefusal(BaseModel):
+    # What the model returns instead of an analysis when the image is unusable
+    error: bool = Field(description="Always true")
+    message: str = Field(description="Issue description")
+    suggestion: str = Field(description="How to improve")
+
+
+AnalysisResponse = TypeAdapter(Union[WaterFootprintAnalysis, ModelRefusal])
+
+
+def analysis_response_schema():
+    return AnalysisResponse.json_schema()
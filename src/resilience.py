@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from .config import config
+from .metrics import get_metrics
+
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_TEXT = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "overloaded", "timeout",
+                  "timed out", "connection", "network")
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+_RETRY_DELAY = re.compile(r"""retryDelay['"]?\s*:\s*['"]?(\d+(?:\.\d+)?)s|retry in (\d+(?:\.\d+)?)\s*s""", re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit open for {name}; retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(TimeoutError):
+    # The analysis ran out of its time budget during `stage`
+    def __init__(self, stage, timeout=None):
+        budget = f" after {timeout:g}s" if timeout else ""
+        super().__init__(f"Request timeout{budget} (during {stage})")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class Deadline:
+    # Absolute time budget for one analysis. Every stage (hashing, rate-limit
+    # waits, retries, the HTTP call, streamed reads) draws on the same budget,
+    # so the caller gets an answer or a DeadlineExceeded by `seconds`.
+    def __init__(self, seconds=None):
+        self.seconds = seconds or None
+        self.expires = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        return None if self.expires is None else max(0.0, self.expires - time.monotonic())
+
+    def exceeded(self, stage):
+        get_metrics().inc('deadline_exceeded_total', stage=stage)
+        return DeadlineExceeded(stage, self.seconds)
+
+    def check(self, stage):
+        if self.expires is not None and time.monotonic() >= self.expires:
+            raise self.exceeded(stage)
+
+    def allows(self, seconds):
+        remaining = self.remaining()
+        return remaining is None or seconds < remaining
+
+
+def is_retryable(error):
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    message = str(error)
+    return any(token.lower() in message.lower() for token in RETRYABLE_TEXT)
+
+
+def retry_hint(error):
+    # Server-suggested delay in seconds: google.rpc.RetryInfo in the error
+    # details, a Retry-After header, or "retry in Ns" in the message.
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    match = _RETRY_DELAY.search(f"{getattr(error, 'details', '')} {error}")
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, hint=None):
+        # Full jitter keeps concurrent clients from retrying in lockstep; a
+        # server hint is a floor. None means the wait would exceed max_delay.
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if hint is not None:
+            backoff = max(hint, backoff)
+        return backoff if backoff <= self.max_delay else None
+
+
+class TokenBucket:
+    # Reservations may push the balance negative; the caller then sleeps for
+    # its share of the deficit, so waiters are served in arrival order.
+    # While paused, `updated` lies in the future and nothing accrues until then.
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _balance(self, now):
+        # Tokens as of now, counting an unfinished pause as a deficit
+        return self.tokens - max(0.0, self.updated - now) * self.rate
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return max(0.0, -self._balance(now) / self.rate)
+
+    def refund(self):
+        # Gives back a reservation the caller will not use
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        # After a 429 nobody should call again until the server's hint elapses:
+        # the refill clock moves to the hinted time, which holds just the
+        # token for the first call due then, so that call waits exactly
+        # `seconds` and the bucket refills from there.
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 1.0)
+            self.updated = max(self.updated, now + seconds)
+
+    def available(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return self._balance(now)
+
+
+class CircuitBreaker:
+    # Opens when the failure rate over the last `window` calls reaches
+    # `failure_rate`, rejects calls for `cooldown` seconds, then lets a single
+    # probe through (half-open) whose outcome closes or re-opens it.
+    def __init__(self, name, failure_rate=0.5, window=20, min_calls=10, cooldown=30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self._transition('half_open')
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self):
+        # A probe abandoned without an outcome must not wedge the breaker
+        with self._lock:
+            self._probing = False
+
+    def retry_in(self):
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                self._outcomes.clear()
+                self._transition('closed' if ok else 'open')
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._outcomes.clear()
+                self._transition('open')
+
+    def _transition(self, state):
+        self.state = state
+        if state == 'open':
+            self.opened_at = time.monotonic()
+        get_metrics().inc('circuit_transitions_total', circuit=self.name, state=state)
+        self._publish()
+
+    def _publish(self):
+        get_metrics().set('circuit_state', CIRCUIT_STATES[self.state], circuit=self.name)
+
+
+class RequestGuard:
+    # Wraps one upstream call with the rate limiter, circuit breaker and
+    # retries. Only transient failures (429, 5xx, timeouts, network) are
+    # retried or count against the breaker.
+    def __init__(self, name, bucket=None, breaker=None, policy=None):
+        self.name = name
+        self.bucket = bucket
+        self.breaker = breaker or CircuitBreaker(name)
+        self.policy = policy or RetryPolicy()
+
+    def _admit(self, deadline):
+        if deadline is not None:
+            deadline.check('call')
+        if not self.breaker.allow():
+            get_metrics().inc('circuit_rejections_total', circuit=self.name)
+            raise CircuitOpenError(self.name, self.breaker.retry_in())
+        if self.bucket is None:
+            return 0.0
+        wait = self.bucket.reserve()
+        if deadline is not None and wait and not deadline.allows(wait):
+            # The slot would open after the deadline; leave it to others
+            self.bucket.refund()
+            self.breaker.release()
+            raise deadline.exceeded('rate_limit')
+        get_metrics().observe('rate_limit_wait_seconds', wait, circuit=self.name)
+        return wait
+
+    def _after_failure(self, error, attempt):
+        # Returns the delay before the next attempt, or None to give up
+        if not is_retryable(error):
+            self.breaker.record(True)
+            return None
+        self.breaker.record(False)
+        hint = retry_hint(error)
+        if hint is not None and self.bucket is not None:
+            # The bucket now holds every caller back for the hinted time
+            self.bucket.pause(hint)
+        if attempt + 1 >= self.policy.max_attempts or (hint or 0) > self.policy.max_delay:
+            return None
+        delay = self.policy.delay(attempt, None if self.bucket is not None else hint)
+        if delay is not None:
+            reason = 'rate_limit' if getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error) else 'transient'
+            get_metrics().inc('retries_total', circuit=self.name, reason=reason)
+        return delay
+
+    def call(self, fn, deadline=None):
+        attempt = 0
+        while True:
+            wait = self._admit(deadline)
+            if wait:
+                time.sleep(wait)
+            try:
+                result = fn()
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.breaker.release()
+                    raise
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                if deadline is not None and not deadline.allows(delay):
+                    raise deadline.exceeded('retry') from e
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record(True)
+            return result
+
+    async def call_async(self, fn, deadline=None):
+        attempt = 0
+        while True:
+            wait = self._admit(deadline)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                if deadline is not None and not deadline.allows(delay):
+                    raise deadline.exceeded('retry') from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record(True)
+            return result
+
+
+def endpoint_label(api_key, model_name):
+    # Metric label for a key/model pair that never exposes the key itself
+    return f"{model_name}:key-{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:6]}"
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def get_request_guard(api_key, model_name):
+    key = (api_key, model_name)
+    with _guards_lock:
+        if key not in _guards:
+            rpm = config.RATE_LIMIT_RPM
+            name = endpoint_label(api_key, model_name)
+            _guards[key] = RequestGuard(
+                name,
+                bucket=TokenBucket(rpm / 60, config.RATE_LIMIT_BURST) if rpm > 0 else None,
+                breaker=CircuitBreaker(
+                    name,
+                    failure_rate=config.CIRCUIT_FAILURE_RATE,
+                    cooldown=config.CIRCUIT_COOLDOWN_SECONDS
+                ),
+                policy=RetryPolicy(
+                    max_attempts=config.RETRY_MAX_ATTEMPTS,
+                    base_delay=config.RETRY_BASE_DELAY_SECONDS,
+                    max_delay=config.RETRY_MAX_DELAY_SECONDS
+                )
+            )
+        return _guards[key]
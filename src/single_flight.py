@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process coalescing is unavailable
+    fcntl = None
+
+from .config import config
+from .metrics import get_metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, deadline=None):
+        # A follower gives up at its own deadline; the leader carries on
+        if not self.done.wait(None if deadline is None else deadline.remaining()):
+            raise deadline.exceeded('coalesced')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    # Concurrent callers with the same key share one execution: the first
+    # becomes the leader, the rest block until it finishes and get its result
+    # (or exception). Keys are forgotten as soon as the call completes.
+    def __init__(self, name="analysis"):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        get_metrics().inc('single_flight_total', flight=self.name, role='leader' if leader else 'follower')
+        return call, leader
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def do(self, key, fn, deadline=None):
+        call, leader = self.join(key)
+        if not leader:
+            return call.wait(deadline)
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    # asyncio counterpart bound to one event loop. The shared task is cancelled
+    # only when every caller waiting on it has been cancelled.
+    def __init__(self, name="analysis"):
+        self.name = name
+        self._tasks = {}
+
+    async def do(self, key, coro_fn):
+        entry = self._tasks.get(key)
+        leader = entry is None
+        if leader:
+            entry = self._tasks[key] = {'task': asyncio.ensure_future(coro_fn()), 'waiters': 0}
+            entry['task'].add_done_callback(lambda _: self._forget(key, entry))
+        get_metrics().inc('single_flight_total', flight=self.name, role='leader' if leader else 'follower')
+
+        entry['waiters'] += 1
+        try:
+            return await asyncio.shield(entry['task'])
+        except asyncio.CancelledError:
+            if entry['waiters'] == 1:
+                entry['task'].cancel()
+            raise
+        finally:
+            entry['waiters'] -= 1
+
+    def _forget(self, key, entry):
+        if self._tasks.get(key) is entry:
+            del self._tasks[key]
+
+
+class FileLock:
+    # Exclusive flock on one of `stripes` lock files under `directory`, so
+    # processes sharing the disk cache take turns on the same key. Striping
+    # bounds the number of files; unrelated keys collide with p = 1/stripes.
+    # With a deadline, a busy lock is polled (flock has no timeout) and the
+    # wait ends in DeadlineExceeded like any other coalesced wait.
+    POLL_SECONDS = 0.02
+
+    def __init__(self, directory, key, stripes=1024, deadline=None):
+        stripe = int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:8], 16) % stripes
+        self.path = os.path.join(directory, f"{stripe:04d}.lock")
+        self.deadline = deadline
+        self.waited = False
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        try:
+            self._acquire()
+        except BaseException:
+            self._file.close()
+            self._file = None
+            raise
+        return self
+
+    def _acquire(self):
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                self.waited = True
+            remaining = None if self.deadline is None else self.deadline.remaining()
+            if remaining is None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+                return
+            if remaining <= 0:
+                raise self.deadline.exceeded('coalesced')
+            time.sleep(min(self.POLL_SECONDS, remaining))
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def process_lock(key, deadline=None):
+    # FileLock when SINGLE_FLIGHT_LOCK_DIR is set (and flock exists), else a no-op
+    if not config.SINGLE_FLIGHT_LOCK_DIR or fcntl is None:
+        return nullcontext()
+    return FileLock(os.path.expanduser(config.SINGLE_FLIGHT_LOCK_DIR), key, deadline=deadline)
+
+
+_single_flight = SingleFlight()
+
+def get_single_flight():
+    return _single_flight
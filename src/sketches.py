@@ -0,0 +1,159 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class KLLSketch:
+    # Streaming quantile sketch (Karnin, Lang & Liberty): a stack of
+    # compactors where level h holds items of weight 2**h. A full level is
+    # sorted and every other item (random offset) is promoted, which keeps
+    # O(k log(n/k)) items for n values with rank error ~1/k independent of
+    # n. Sketches of disjoint streams merge level by level, so each worker
+    # can sketch its own scans and the results combine to one sketch.
+    C = 2 / 3
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.levels = [np.empty(0)]
+        self._pending = []  # single updates, appended to level 0 in bulk
+        self._rng = np.random.default_rng(seed)
+        self._sizes()
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def rank_error(self):
+        # Normalized rank error at ~99% confidence, as measured by
+        # benchmarks/check_quantile_sketches.py
+        return 2.3 / self.k ** 0.97
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * self.C ** depth)), 2)
+
+    def _sizes(self):
+        self._retained = sum(len(level) for level in self.levels)
+        self._max_retained = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        # Compact the lowest full level until the sketch fits again
+        if self._pending:
+            self.levels[0] = np.concatenate([self.levels[0], self._pending])
+            self._pending = []
+        self._sizes()
+        while self._retained >= self._max_retained:
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(level)
+            # An odd item out stays behind at this level
+            keep, pairs = level[:len(level) % 2], level[len(level) % 2:]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], pairs[self._rng.integers(2)::2]])
+            self._sizes()
+
+    def update(self, value):
+        value = float(value)
+        self.n += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._pending.append(value)
+        if self._retained + len(self._pending) >= self._max_retained:
+            self._compress()
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f"cannot merge sketches with k={self.k} and k={other.k}")
+        if other.n == 0:
+            return self
+        other._compress()
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        self._compress()
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def rank(self, value):
+        # Estimated fraction of values <= `value`
+        if not self.n:
+            return None
+        items, cumulative = self._weighted()
+        i = np.searchsorted(items, value, side='right')
+        return float(cumulative[i - 1] / cumulative[-1]) if i else 0.0
+
+    def quantiles(self, fractions):
+        if not self.n:
+            return [None] * len(fractions)
+        items, cumulative = self._weighted()
+        targets = np.asarray(fractions, dtype=np.float64) * cumulative[-1]
+        indices = np.minimum(np.searchsorted(cumulative, targets, side='left'), len(items) - 1)
+        result = items[indices]
+        # The exact extremes are tracked, so q=0 and q=1 are exact
+        result = np.where(np.asarray(fractions) <= 0, self.min, result)
+        result = np.where(np.asarray(fractions) >= 1, self.max, result)
+        return result.tolist()
+
+    def quantile(self, fraction):
+        return self.quantiles([fraction])[0]
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'k': self.k,
+            'n': self.n,
+            'min': self.min if self.n else None,
+            'max': self.max if self.n else None,
+            'levels': [level.tolist() for level in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data['k'], seed)
+        sketch.n = data['n']
+        if sketch.n:
+            sketch.min, sketch.max = data['min'], data['max']
+        sketch.levels = [np.asarray(level, dtype=np.float64) for level in data['levels']] or [np.empty(0)]
+        sketch._sizes()
+        return sketch
+
+
+def save_json(path, data):
+    # Written to a temp file and renamed, so readers never see half a file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, separators=(',', ':')))
+    os.replace(tmp, path)
+
+
+def load_json(path):
+    return json.loads(Path(path).read_text())
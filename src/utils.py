@@ -1,6 +1,10 @@
 import io
-from PIL import Image
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageOps
 from .config import config
+from .resilience import DeadlineExceeded
 
 
 def validate_image(image_data, max_size_mb=None):
@@ -34,15 +38,200 @@ def resize_image_if_needed(image_data, max_dim=2048):
     return output.getvalue()
 
 
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+
+
 def get_image_mime_type(image_data):
     try:
         image = Image.open(io.BytesIO(image_data))
-        types = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
-        return types.get(image.format, 'image/jpeg')
+        return MIME_TYPES.get(image.format, 'image/jpeg')
     except:
         return 'image/jpeg'
 
 
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_PX = 768
+
+
+def estimate_image_tokens(width, height):
+    # Gemini bills images up to 384px as one 258-token tile; larger images are
+    # cut into 768x768 tiles at 258 tokens each
+    if max(width, height) <= 384:
+        return IMAGE_TILE_TOKENS
+    return -(-width // IMAGE_TILE_PX) * -(-height // IMAGE_TILE_PX) * IMAGE_TILE_TOKENS
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    format: str
+    width: int
+    height: int
+    original_bytes: int
+    thumbnail: bytes
+    model_width: int = 0
+    model_height: int = 0
+    original_tokens: int = 0
+    estimated_tokens: int = 0
+    
+    @property
+    def resized(self):
+        return (self.model_width, self.model_height) != (self.width, self.height)
+    
+    @property
+    def optimized(self):
+        # Re-encoding alone (e.g. a PNG photo sent as JPEG) also saves bytes
+        return self.resized or self.bytes_saved > 0
+    
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - len(self.data)
+    
+    @property
+    def tokens_saved(self):
+        return self.original_tokens - self.estimated_tokens
+
+
+def prepare_image(image_data, max_dim=None, thumbnail_dim=800, max_size_mb=None, quality=None, deadline=None):
+    # One decode yields everything app.py needs: validation, model payload and
+    # a display thumbnail. Returns (PreparedImage, None) or (None, error);
+    # raises DeadlineExceeded if `deadline` runs out between stages.
+    max_dim = max_dim or config.MODEL_IMAGE_MAX_DIM
+    quality = quality or config.MODEL_IMAGE_QUALITY
+    max_size = max_size_mb or config.MAX_IMAGE_SIZE_MB
+    size_mb = len(image_data) / (1024 * 1024)
+    if size_mb > max_size:
+        return None, f"Image too large ({size_mb:.1f}MB). Max: {max_size}MB"
+    
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image_format = image.format or 'JPEG'
+        stored_size = image.size
+        
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale directly; ask for the
+        # smallest scale that still covers both targets
+        target = max(max_dim, thumbnail_dim)
+        if image_format == 'JPEG' and max(stored_size) > target:
+            ratio = target / max(stored_size)
+            image.draft('RGB', (int(stored_size[0] * ratio), int(stored_size[1] * ratio)))
+        image.load()
+        
+        drafted = image.size != stored_size
+        decoded = image
+        if image.getexif().get(0x0112, 1) != 1:
+            decoded = ImageOps.exif_transpose(image)
+        width, height = stored_size
+        if decoded.size != image.size:
+            width, height = height, width
+        
+        model_image = decoded
+        if max(decoded.size) > max_dim:
+            ratio = max_dim / max(decoded.size)
+            new_size = tuple(max(1, round(d * ratio)) for d in decoded.size)
+            model_image = decoded.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        
+        model_width, model_height = model_image.size
+        if deadline is not None:
+            deadline.check('resize')
+        untouched = model_image is image and not drafted
+        if untouched and image_format == 'JPEG':
+            data, data_format = image_data, 'JPEG'
+        else:
+            output = io.BytesIO()
+            if _has_alpha(model_image):
+                data_format = 'WEBP'
+                model_image.save(output, format='WEBP', quality=quality)
+            else:
+                data_format = 'JPEG'
+                model_image.convert('RGB').save(output, format='JPEG', quality=quality, optimize=True)
+            data = output.getvalue()
+            if untouched and len(data) >= len(image_data) and image_format in MIME_TYPES:
+                data, data_format = image_data, image_format
+        
+        if deadline is not None:
+            deadline.check('encode')
+        
+        thumb = decoded
+        thumb.thumbnail((thumbnail_dim, thumbnail_dim), Image.Resampling.BILINEAR)
+        output = io.BytesIO()
+        if _has_alpha(thumb):
+            thumb.save(output, format='PNG')
+        else:
+            thumb.convert('RGB').save(output, format='JPEG', quality=85)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return None, f"Invalid image: {str(e)}"
+    
+    return PreparedImage(
+        data=data,
+        mime_type=MIME_TYPES.get(data_format, 'image/jpeg'),
+        format=image_format,
+        width=width,
+        height=height,
+        original_bytes=len(image_data),
+        thumbnail=output.getvalue(),
+        model_width=model_width,
+        model_height=model_height,
+        original_tokens=estimate_image_tokens(width, height),
+        estimated_tokens=estimate_image_tokens(model_width, model_height)
+    ), None
+
+
+def _hash_grayscale(image_data, size):
+    image = Image.open(io.BytesIO(image_data))
+    image.draft('L', (size[0] * 4, size[1] * 4))
+    image = image.convert('L').resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def compute_dhash(image_data, hash_size=8):
+    pixels = _hash_grayscale(image_data, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_MATRICES = {}
+
+def _dct_matrix(n):
+    if n not in _DCT_MATRICES:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+        matrix[0] /= np.sqrt(2)
+        _DCT_MATRICES[n] = matrix.astype(np.float32)
+    return _DCT_MATRICES[n]
+
+
+def compute_phash(image_data, hash_size=8, highfreq_factor=4):
+    n = hash_size * highfreq_factor
+    pixels = _hash_grayscale(image_data, (n, n))
+    dct = _dct_matrix(n)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def perceptual_hash(image_data, method='dhash'):
+    try:
+        if method == 'phash':
+            return compute_phash(image_data)
+        return compute_dhash(image_data)
+    except Exception:
+        return None
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
 def format_number(n):
     if n >= 1_000_000_000:
         return f"{n / 1_000_000_000:.1f}B"